@@ -10,3 +10,25 @@ class SpeedwayScraperItem(scrapy.Item):
     # define the fields for your item here like:
     # name = scrapy.Field()
     pass
+
+
+class MatchItem(scrapy.Item):
+    """Aggregated data for one match page: metadata, lineups, heat-by-heat results and telemetry."""
+    source = scrapy.Field()
+    match_url = scrapy.Field()
+    competition = scrapy.Field()
+    round_type = scrapy.Field()
+    round = scrapy.Field()
+    match_date = scrapy.Field()
+    attendance_summary = scrapy.Field()
+    referee = scrapy.Field()
+    track_commissioner = scrapy.Field()
+    arena = scrapy.Field()
+    home_team_details = scrapy.Field()
+    home_score_details = scrapy.Field()
+    away_team_details = scrapy.Field()
+    away_score_details = scrapy.Field()
+    team1 = scrapy.Field()
+    team2 = scrapy.Field()
+    match_details = scrapy.Field()
+    telemetry_data = scrapy.Field()
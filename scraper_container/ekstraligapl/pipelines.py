@@ -6,8 +6,84 @@
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+import asyncio
+import os
+import json
+import uuid
+
+try:
+    import orjson # C serializer; optional, falls back to the stdlib json module
+except ImportError:
+    orjson = None
+
+from ekstraligapl.items import MatchItem
+
+# Single-pass translations making match fields safe for use in file names
+_TEAM_FILENAME_TABLE = str.maketrans({" ": "_", "/": "_"})
+_DATE_FILENAME_TABLE = str.maketrans({" ": "T", ":": "-", "/": "-"})
+_NAME_FILENAME_TABLE = str.maketrans("", "", " /")
+
+
+def _write_json(output_path, match_data):
+    """
+    Serializes match_data and writes it to output_path. It is written under a unique temporary name (not matching
+    data_transformer.py's *.json filter) and renamed into place, so the transformer never reads a half-written file
+    and two items with the same file name never write the same temporary file.
+    """
+    if orjson is not None:
+        data = orjson.dumps(match_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        data = json.dumps(match_data, ensure_ascii=False, indent=2).encode('utf-8') # orjson only indents by 2
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    f = open(tmp_path, 'xb') # Exclusive create; the process umask applies as for any other output file
+    try:
+        with f:
+            f.write(data)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path) # Do not leave the partial file behind
+        raise
 
 
 class SpeedwayScraperPipeline:
     def process_item(self, item, spider):
         return item
+
+
+class MatchJsonWriterPipeline:
+    """
+    Saves each scraped match as a JSON file in the output directory, where data_transformer.py picks it up.
+    Keeping the file write here leaves the spider callback to do extraction only.
+    The output directory is created once in open_spider, not per match.
+    """
+    output_dir = 'output'
+
+    def open_spider(self, spider):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    async def process_item(self, item, spider):
+        if not isinstance(item, MatchItem):
+            return item
+
+        match_data = ItemAdapter(item).asdict()
+
+        # Generate filename for match data
+        # `or` also covers fields the spider extracted as None
+        home_team = (match_data.get('home_team_details') or 'unknown_home_team').translate(_TEAM_FILENAME_TABLE)
+        away_team = (match_data.get('away_team_details') or 'unknown_away_team').translate(_TEAM_FILENAME_TABLE)
+        date_time = (match_data.get('match_date') or 'unknown_date').translate(_DATE_FILENAME_TABLE)
+        comptetition_name = (match_data.get('competition') or 'unknown_competition').translate(_NAME_FILENAME_TABLE)
+        round_type_name = (match_data.get('round_type') or 'unknown_round_type').translate(_NAME_FILENAME_TABLE)
+
+        filename = f"output_{comptetition_name}_{round_type_name}_{home_team}-{away_team}_{date_time}.json"
+        output_path = os.path.join(self.output_dir, filename)
+
+        # Save the match data to a JSON file. Serialization and disk I/O run in a worker thread,
+        # so the event loop keeps driving the other matches' Playwright pages meanwhile.
+        try:
+            await asyncio.to_thread(_write_json, output_path, match_data)
+            spider.logger.info("Saved match data to %s", output_path)
+        except Exception as e:
+            spider.logger.error("Failed to save match data to %s: %s", output_path, e)
+
+        return item
@@ -64,9 +64,9 @@ ROBOTSTXT_OBEY = True
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "ekstraligapl.pipelines.EkstraligaScraperPipeline": 300,
-#}
+ITEM_PIPELINES = {
+    "ekstraligapl.pipelines.MatchJsonWriterPipeline": 300,
+}
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -91,6 +91,7 @@ ROBOTSTXT_OBEY = True
 
 # Set settings whose default value is deprecated to a future-proof value
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
+ASYNCIO_EVENT_LOOP = "uvloop.Loop" # libuv-based loop under the asyncio reactor; the Playwright coroutines await on it
 FEED_EXPORT_ENCODING = "utf-8"
 
 # Settings for quieter logging and Playwright configuration
@@ -100,8 +101,10 @@ custom_settings = {
     'LOG_ENABLED': True,
     'CONCURRENT_REQUESTS': 8,
     'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
-    'PLAYWRIGHT_MAX_CONTEXTS': 8,
-    'PLAYWRIGHT_MAX_PAGES_PER_CONTEXT': 1,
+    # All match pages share the one 'default' browser context (warm cache, cookies and connections);
+    # its page limit matches CONCURRENT_REQUESTS so pages are not serialized.
+    'PLAYWRIGHT_MAX_CONTEXTS': 1,
+    'PLAYWRIGHT_MAX_PAGES_PER_CONTEXT': 8,
     # 'DOWNLOAD_TIMEOUT': 120, # Default is 180s. Adjust if needed.
     # Playwright default page.goto timeout is 30s.
     # scrapy-playwright's default navigation timeout is handler's page.goto_timeout or PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT (60s)
@@ -1,12 +1,44 @@
 import scrapy
+import asyncio
 import re
+import sys
+from collections import Counter
 from pathlib import Path
-from scrapy.http import HtmlResponse
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
 import psycopg2
 import os
-import json
 import datetime
 
+from ekstraligapl.items import MatchItem
+
+_css_translator = HTMLTranslator()
+
+def _css_xpath(css):
+    """Compiles a CSS selector (including parsel's ::text pseudo-element) into a reusable lxml XPath."""
+    return etree.XPath(_css_translator.css_to_xpath(css))
+
+def _staff_name(span):
+    """Returns the name after the ':' in a lineup staff span (e.g. 'Manager: John Doe'), or None."""
+    text = "".join(span.itertext())
+    return text.split(':')[-1].strip() if ':' in text else None
+
+def _value_or(value, default):
+    """Returns value unless it is None (e.g. a cell missing from a Playwright evaluate result)."""
+    return value if value is not None else default
+
+def _xpath_all(compiled_xpath, elements):
+    """Evaluates a compiled XPath against each element and concatenates the results in document order."""
+    return [result for element in elements for result in compiled_xpath(element)]
+
+def _xpath_first(compiled_xpath, elements, default=None):
+    """Returns the first result of a compiled XPath over the given elements, like SelectorList.get()."""
+    for element in elements:
+        results = compiled_xpath(element)
+        if results:
+            return results[0]
+    return default
+
 class ScheduleSpider(scrapy.Spider):
     """
     Spider for scraping speedway match data from the Ekstraliga website.
@@ -51,13 +83,23 @@ class ScheduleSpider(scrapy.Spider):
         'LOG_ENABLED': True,
         'CONCURRENT_REQUESTS': 8,
         'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
-        'PLAYWRIGHT_MAX_CONTEXTS': 8,
-        'PLAYWRIGHT_MAX_PAGES_PER_CONTEXT': 1,
+        # All match pages share the one 'default' browser context (warm cache, cookies and connections);
+        # its page limit matches CONCURRENT_REQUESTS so pages are not serialized.
+        'PLAYWRIGHT_MAX_CONTEXTS': 1,
+        'PLAYWRIGHT_MAX_PAGES_PER_CONTEXT': 8,
         # 'DOWNLOAD_TIMEOUT': 120, # Default is 180s. Adjust if needed.
         # Playwright default page.goto timeout is 30s.
         # scrapy-playwright's default navigation timeout is handler's page.goto_timeout or PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT (60s)
     }
 
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        # *** OPTIMIZATION: Resource Blocking - Test thoroughly! ***
+        # scrapy-playwright applies the predicate to every request it routes, so blocking covers each page's initial load too.
+        # If telemetry interactions break, remove or refine this blocking (see should_block_request).
+        settings.set('PLAYWRIGHT_ABORT_REQUEST', cls.should_block_request, priority='spider')
+
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super(ScheduleSpider, cls).from_crawler(crawler, *args, **kwargs)
@@ -67,10 +109,131 @@ class ScheduleSpider(scrapy.Spider):
         spider.conn = None
         spider.cursor = None
         spider.urls_to_process = [] # List of (url, is_current_season) tuples
-        spider.pending_match_requests = {} # {starting_url: {match_url1, match_url2, ...}}
+        spider.pending_match_counts = Counter() # {starting_url: number of queued match requests not yet parsed}
         spider.start_url_meta = {} # {starting_url: is_current_season}
+        spider.known_match_urls = set() # match_url values already stored in the matches table or queued in this run
+        spider.scraped_url_queue = None # Completed non-current starting URLs awaiting the batched is_scraped update
+        spider.scraped_url_flusher = None # Background task draining scraped_url_queue
         return spider
 
+    # Selectors and patterns compiled once instead of on every response
+    MATCH_URL_RE = re.compile(r'/se/mecz/\d{4}$')
+    ROUND_NUMBER_RE = re.compile(r'(\d+)')
+
+    # Class tokens of the page sections, matched in a single walk over the document's divs
+    # (section name, required class tokens, only divs without child divs)
+    MATCH_PAGE_DIVS = (
+        ('match_info', frozenset({
+            'bg-[#621968cc]', 'mt-[1px]', 'flex', 'w-full', 'flex-col', 'justify-center', 'px-7', 'py-4', 'text-center',
+            'text-sm', 'text-white', 'first:rounded-t-lg', 'last:rounded-b-lg', 'theme-m2e:bg-darkblue10/80'}), False),
+        ('officials', frozenset({
+            'bg-[#3b0f3fcc]', 'mt-[1px]', 'flex', 'w-full', 'justify-center', 'px-7', 'py-4', 'text-center',
+            'text-sm', 'text-white', 'theme-m2e:bg-darkblue6/80'}), False),
+        ('arena', frozenset({
+            'bg-[#3b0f3fcc]', 'mt-[1px]', 'flex', 'w-full', 'flex-col', 'justify-center', 'px-7', 'py-4', 'text-center',
+            'text-sm', 'text-white', 'theme-m2e:bg-darkblue6/80'}), True),
+        ('team_name', frozenset({'text-center', 'font-kallisto', 'text-sm'}), False),
+        ('score', frozenset({'my-2.5', 'box-content', 'w-20', 'rounded-lg', 'bg-green1'}), False),
+        ('lineups_container', frozenset({'flex', 'basis-3/4', 'flex-col', 'flex-wrap', 'gap-7', 'xl:flex-row'}), False),
+        ('heat_block', frozenset({'mx-auto', 'mb-5', 'max-w-[520px]'}), False),
+    )
+    DIRECT_TEXT_XPATH = etree.XPath('./text()')
+
+    REFEREE_TEXT_XPATH = etree.XPath(".//div[1]/p[2]/text()")
+    TRACK_COMMISSIONER_TEXT_XPATH = etree.XPath(".//div[2]/p[2]/text()")
+    ARENA_TEXT_XPATH = etree.XPath(".//p/text()")
+    COMPETITION_TEXT_XPATH = etree.XPath(".//p[@class='pb-1 font-semibold uppercase']/text()")
+    ROUND_TYPE_TEXT_XPATH = etree.XPath(".//p[2]/text()")
+    ROUND_TEXT_XPATH = etree.XPath(".//p[3]/text()")
+    MATCH_DATE_TEXT_XPATH = etree.XPath(".//p[4]/text()")
+
+    LINEUP_TEAM_XPATH = _css_xpath('div.mb-5.w-full.max-w-full.xl\\:mb-0.xl\\:max-w-\\[calc\\(50\\%_\\-_14px\\)\\]')
+    LINEUP_TEAM_NAME_TEXT_XPATH = _css_xpath('div.truncate.max-w-\\[calc\\(100\\%_\\-_50px\\)\\]::text')
+    LINEUP_STAFF_XPATH = _css_xpath('div.mb-4.mt-4.flex.flex-col.justify-end.text-sm.text-white')
+    LINEUP_STAFF_SPAN_XPATH = etree.XPath(".//span[@class='text-right']")
+    LINEUP_RIDER_ROW_XPATH = _css_xpath('table.w-full.text-white tbody tr')
+    LINEUP_RIDER_NUMBER_TEXT_XPATH = _css_xpath('td.text-center::text')
+    LINEUP_RIDER_FIRST_NAME_TEXT_XPATH = _css_xpath('td a span.inline-block::text')
+    LINEUP_RIDER_LAST_NAME_TEXT_XPATH = _css_xpath('td a span.inline-block span.uppercase::text')
+    # Heat score columns 3-8 of a lineup row; each cell's text is read like 'td.text-center:nth-child(i) *::text'
+    LINEUP_RIDER_SCORE_COLUMNS = 6
+    LINEUP_RIDER_SCORE_CELLS_XPATH = etree.XPath('./*[position() >= 3 and position() <= 8]')
+    LINEUP_RIDER_SCORE_CELL_TEXT_XPATH = etree.XPath('.//*/text()')
+    LINEUP_RIDER_SUM_TEXT_XPATH = _css_xpath('td.text-center.text-green1 strong::text')
+    LINEUP_RIDER_BONUS_TEXT_XPATH = _css_xpath('td.text-center:last-child::text')
+
+    HEAT_NUMBER_XPATH_EXPR = './/div[contains(@class, "mb-2.5")]//text()'
+    HEAT_NUMBER_TEXT_XPATH = etree.XPath(HEAT_NUMBER_XPATH_EXPR)
+    HEAT_TEAM_SCORE_XPATH = etree.XPath('.//td[contains(@class, "box-content") and contains(@class, "w-6") and contains(@class, "text-center") and contains(@class, "font-kallisto") and contains(@class, "lg:w-12") and @rowspan="2"]')
+    FIRST_TEXT_XPATH = etree.XPath('string(./text())') # First direct text node, or '' (like ./text() .get() or "")
+    HEAT_ROWS_XPATH = etree.XPath('.//tbody/tr')
+    # Helmet "!bg-" class values -> helmet color; values not listed fall back to the substring checks
+    HELMET_COLORS = {
+        "red-500": "red", "red-600": "red", "white": "white", "blue-500": "blue", "blue-600": "blue",
+        "yellow-400": "yellow", "yellow-500": "yellow"}
+    # All rider fields of a heat row in one evaluation, joined with a separator that does not occur in page text:
+    # starting field, helmet color class, rider, substituted rider, rider score, warning
+    HEAT_RIDER_FIELD_SEPARATOR = '\u241f'
+    HEAT_RIDER_FIELDS_XPATH = etree.XPath("concat(" + f", '{HEAT_RIDER_FIELD_SEPARATOR}', ".join([
+        'string(./td[1]/text())',
+        'string(./td[1]/@class)',
+        'normalize-space(./td[3]/div[not(contains(@class, "line-through"))])',
+        'normalize-space(./td[3]/div[contains(@class, "line-through")])',
+        'string(./td[4]/text())',
+        'string(./td[contains(@class, "box-content") and contains(@class, "w-3") and contains(@class, "text-center")]//span/text())',
+    ]) + ")")
+
+    # Playwright request blocking, applied from navigation on. Stylesheets and other hosts (e.g. an app bundle CDN) stay
+    # allowed: the initial render and the state='visible' waits have not been verified on a page loaded without them.
+    BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media"})
+    TRACKER_URL_RE = re.compile(r"(googletagmanager|google-analytics|doubleclick|hotjar|facebook\.net)")
+
+    # Reads the summary cells of every telemetry table row in one browser round-trip.
+    # Expanded sub-table rows (td[colspan="6"]) map to null; missing cells to null.
+    TELEMETRY_ROW_SUMMARY_JS = """(rows) => rows.map(row => {
+        if (row.querySelector('td[colspan="6"]')) return null;
+        const cell = (n) => {
+            const td = row.querySelector(`td:nth-child(${n})`);
+            return td ? td.innerText.trim() : null;
+        };
+        return {
+            rider_number: cell(2), team_code: cell(3), rider_name: cell(4),
+            best_time: cell(5), vmax_summary: cell(6),
+        };
+    })"""
+
+    # Columns of a rider's expanded telemetry sub-table, in cell order
+    TELEMETRY_DETAIL_KEYS = ('heat_number', 'lap_time', 'distance', 'vmax_lap', 'lap1_time', 'lap2_time', 'lap3_time', 'lap4_time')
+    TELEMETRY_COLLAPSE_ROWS = False # Click each expanded row closed again after reading it (two extra round-trips per rider)
+    # Resolves true as soon as a DOM mutation detaches or hides the row (no layout box), or with the row's state once
+    # the timeout has passed. Edge-triggered by a MutationObserver instead of polled.
+    TELEMETRY_ROW_GONE_WAIT_JS = """([row, timeout]) => new Promise(resolve => {
+        const gone = () => !row.isConnected || row.getClientRects().length === 0;
+        if (gone()) return resolve(true);
+        const observer = new MutationObserver(() => {
+            if (gone()) { observer.disconnect(); clearTimeout(timer); resolve(true); }
+        });
+        observer.observe(document.body, {childList: true, subtree: true, attributes: true, attributeFilter: ['class', 'style', 'hidden']});
+        const timer = setTimeout(() => { observer.disconnect(); resolve(gone()); }, timeout);
+    })"""
+    TELEMETRY_ROW_GONE_WAIT_MS = 150
+    # Reads the cell texts of every sub-table row in one browser round-trip, without serializing the table's HTML.
+    # Each td gives its first text node (as td:nth-child(k)::text did), or '' if it has none;
+    # rows with fewer cells than the given width are padded with ''.
+    TELEMETRY_SUB_ROW_CELLS_JS = """(rows, width) => rows.map(row => {
+        const texts = Array.from(row.children)
+            .filter(cell => cell.tagName === 'TD')
+            .map(cell => {
+                const text = Array.from(cell.childNodes).find(node => node.nodeType === Node.TEXT_NODE);
+                return text ? text.textContent.trim() : '';
+            });
+        while (texts.length < width) texts.push('');
+        return texts;
+    })"""
+
+    KNOWN_MATCH_URLS_BATCH_SIZE = 10000 # Rows per round-trip when streaming existing match URLs
+    SCRAPED_URL_FLUSH_INTERVAL = 2 # Seconds completed starting URLs are coalesced before one is_scraped UPDATE
+
     # Database connection parameters
     DB_HOST = os.environ.get('POSTGRES_HOST', 'db')
     DB_NAME = os.environ.get('POSTGRES_DB', 'speedway_db')
@@ -91,13 +254,26 @@ class ScheduleSpider(scrapy.Spider):
                 if not self.urls_to_process:
                     self.logger.warning("No URLs found in data_source table to scrape (is_scraped=false).")
                 else:
-                    self.logger.info(f"Fetched {len(self.urls_to_process)} URLs to scrape from the database.")
+                    self.logger.info("Fetched %s URLs to scrape from the database.", len(self.urls_to_process))
             except psycopg2.Error as e:
-                self.logger.error(f"Error fetching URLs from database: {e}")
+                self.logger.error("Error fetching URLs from database: %s", e)
                 self.urls_to_process = [] # Ensure it's empty on error
 
+            # Load already stored match URLs once, so parse() can skip them without a query per link.
+            # A named (server-side) cursor streams the rows in batches instead of materializing them all client-side first.
+            try:
+                with self.conn.cursor(name='known_match_urls') as url_cursor:
+                    url_cursor.itersize = self.KNOWN_MATCH_URLS_BATCH_SIZE
+                    url_cursor.execute("SELECT match_url FROM matches")
+                    self.known_match_urls = {row[0] for row in url_cursor}
+                self.logger.info("Loaded %s existing match URLs from the database.", len(self.known_match_urls))
+            except psycopg2.Error as e:
+                self.logger.error("Error fetching existing match URLs from database: %s. Existing matches will be scraped again.", e)
+                self.conn.rollback() # Clear the aborted transaction so later statements can run
+                self.known_match_urls = set()
+
         except psycopg2.Error as e:
-            self.logger.error(f"Error connecting to PostgreSQL Database: {e}")
+            self.logger.error("Error connecting to PostgreSQL Database: %s", e)
             self.conn = None
             self.cursor = None
 
@@ -112,14 +288,17 @@ class ScheduleSpider(scrapy.Spider):
             return
 
         for url, is_current in self.urls_to_process:
-            self.logger.info(f"Queueing starting URL from DB: {url} (Is current season: {is_current})")
+            self.logger.info("Queueing starting URL from DB: %s (Is current season: %s)", url, is_current)
             # Initialize tracking for this starting URL
             self.start_url_meta[url] = is_current
-            self.pending_match_requests[url] = set()
+            self.pending_match_counts[url] = 0
             yield scrapy.Request(url, callback=self.parse, meta={'starting_url': url})
 
-    def close_spider(self, spider):
-        """Closes database connection when the spider finishes."""
+    async def close_spider(self, spider):
+        """Flushes the queued is_scraped updates, then closes database connection when the spider finishes."""
+        if self.scraped_url_flusher:
+            self.scraped_url_queue.put_nowait(None) # Sentinel: flush what is queued, then stop
+            await self.scraped_url_flusher
         if self.cursor:
             self.cursor.close()
             self.logger.info("Database cursor closed.")
@@ -127,18 +306,82 @@ class ScheduleSpider(scrapy.Spider):
             self.conn.close()
             self.logger.info("Database connection closed.")
 
+    def _mark_starting_urls_scraped(self, starting_urls):
+        """Sets is_scraped=true for a batch of starting URLs in one statement and commit. Blocking; called from a worker thread with its own cursor."""
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("UPDATE public.data_source SET is_scraped = true WHERE url = ANY(%s)", (starting_urls,))
+            self.conn.commit()
+            self.logger.info("Successfully marked %s starting URLs as scraped in the database: %s", len(starting_urls), starting_urls)
+        except psycopg2.Error as e:
+            self.logger.error("Database error updating is_scraped for %s: %s", starting_urls, e)
+            self.conn.rollback()
+
+    def _queue_starting_url_scraped(self, starting_url):
+        """Queues a starting URL for the batched is_scraped update, starting the flusher task on first use."""
+        if self.scraped_url_flusher is None:
+            # Created here rather than in from_crawler so both belong to the running asyncio loop
+            self.scraped_url_queue = asyncio.Queue()
+            self.scraped_url_flusher = asyncio.ensure_future(self._flush_scraped_urls())
+        self.scraped_url_queue.put_nowait(starting_url)
+
+    async def _flush_scraped_urls(self):
+        """
+        Background task writing queued starting URLs to the database. Completions arriving within
+        SCRAPED_URL_FLUSH_INTERVAL of the first one share a single UPDATE and commit. Stops at the None sentinel.
+        """
+        stopping = False
+        while not stopping:
+            starting_url = await self.scraped_url_queue.get()
+            if starting_url is None:
+                break
+            starting_urls = [starting_url]
+            await asyncio.sleep(self.SCRAPED_URL_FLUSH_INTERVAL)
+            while not self.scraped_url_queue.empty():
+                starting_url = self.scraped_url_queue.get_nowait()
+                if starting_url is None:
+                    stopping = True
+                else:
+                    starting_urls.append(starting_url)
+            # Run the blocking psycopg2 call in a worker thread so the reactor keeps serving other pages
+            await asyncio.to_thread(self._mark_starting_urls_scraped, starting_urls)
+
+    @classmethod
+    def should_block_request(cls, request):
+        """Returns True for Playwright requests that do not contribute to the page data (media assets, trackers)."""
+        if request.resource_type in cls.BLOCKED_RESOURCE_TYPES:
+            return True
+        return bool(cls.TRACKER_URL_RE.search(request.url))
+
+    @classmethod
+    def _collect_page_divs(cls, root):
+        """
+        Walks the document's divs once and groups them by the MATCH_PAGE_DIVS section whose class tokens they carry.
+        Lists keep document order; a div can belong to several sections, like the separate XPath queries it replaces.
+        """
+        page_divs = {name: [] for name, _, _ in cls.MATCH_PAGE_DIVS}
+        for div in root.iter('div'):
+            class_attr = div.get('class')
+            if not class_attr:
+                continue
+            tokens = frozenset(class_attr.split())
+            for name, required_tokens, leaf_only in cls.MATCH_PAGE_DIVS:
+                if required_tokens <= tokens and not (leaf_only and div.find('div') is not None):
+                    page_divs[name].append(div)
+        return page_divs
+
     def parse(self, response):
         """
         Parse the schedule page (a starting URL) to find and follow links to individual match pages.
         """
         starting_url = response.meta.get('starting_url')
         if not starting_url:
-            self.logger.error(f"Missing 'starting_url' in meta for response {response.url}. Cannot track completion.")
+            self.logger.error("Missing 'starting_url' in meta for response %s. Cannot track completion.", response.url)
             return
 
-        self.logger.info(f"Parsing schedule page: {response.url} (Originating from: {starting_url})")
+        self.logger.info("Parsing schedule page: %s (Originating from: %s)", response.url, starting_url)
         match_containers_selector = 'a.relative.flex.items-center.justify-between'
-        self.logger.debug(f"Using CSS selector to find match containers: {match_containers_selector}")
+        self.logger.debug("Using CSS selector to find match containers: %s", match_containers_selector)
         match_containers = response.css(match_containers_selector)
 
         if not match_containers:
@@ -146,37 +389,29 @@ class ScheduleSpider(scrapy.Spider):
             return
 
         found_count = 0
-        match_url_pattern = re.compile(r'/se/mecz/\d{4}$')
 
         for container in match_containers:
             href = container.css('::attr(href)').get()
             match_url = None
             is_match_link = False
 
-            if href and match_url_pattern.search(href):
+            if href and self.MATCH_URL_RE.search(href):
                 is_match_link = True
                 match_url = response.urljoin(href)
-                self.logger.debug(f"Found valid match link: {href}")
+                self.logger.debug("Found valid match link: %s", href)
             elif href:
-                self.logger.debug(f"Found link that is NOT a match link: {href}. Skipping.")
+                self.logger.debug("Found link that is NOT a match link: %s. Skipping.", href)
 
             if not is_match_link:
-                self.logger.debug(f"Skipping container as href is missing or not a match link: {href}")
+                self.logger.debug("Skipping container as href is missing or not a match link: %s", href)
                 continue
 
-            # Check if the match_url already exists in the database
-            if self.cursor:
-                try:
-                    self.cursor.execute("SELECT 1 FROM matches WHERE match_url = %s", (match_url,))
-                    exists = self.cursor.fetchone()
-                    if exists:
-                        self.logger.info(f"Match URL already exists in database, skipping: {match_url}")
-                        continue # Skip this URL if it's already in the database
-                except psycopg2.Error as e:
-                    self.logger.error(f"Database error while checking URL {match_url}: {e}. Proceeding with scraping.")
-            else:
-                self.logger.warning(f"Database connection not available. Cannot check for existing URLs. Proceeding with scraping {match_url}.")
-
+            # Check if the match_url already exists in the database (preloaded in open_spider) or was queued already
+            if match_url in self.known_match_urls:
+                self.logger.info("Match URL already exists in database or is already queued, skipping: %s", match_url)
+                continue # Skip this URL if it's already in the database
+            # Scrapy's dupefilter would drop a second request for it, which would then never decrement its pending count
+            self.known_match_urls.add(match_url)
 
             found_count += 1
             date_time_summary = container.css('div.flex.flex-1 > div:nth-child(2) span.schedule-events__label:not(.schedule-events__attendance) span::text').get()
@@ -185,36 +420,37 @@ class ScheduleSpider(scrapy.Spider):
             date_time_summary = date_time_summary.strip() if date_time_summary else None
             attendance_summary = attendance_summary.strip() if attendance_summary else None
 
-            # Add match_url to the tracking set for its starting_url
-            if starting_url in self.pending_match_requests:
-                self.pending_match_requests[starting_url].add(match_url)
-                self.logger.debug(f"Added {match_url} to pending requests for {starting_url}. Current count: {len(self.pending_match_requests[starting_url])}")
-            else:
+            # Count match_url as pending for its starting_url
+            if starting_url not in self.pending_match_counts:
                 # This case should ideally not happen if start_requests initialized correctly
-                self.logger.warning(f"Starting URL {starting_url} not found in pending_match_requests when adding {match_url}. Initializing.")
-                self.pending_match_requests[starting_url] = {match_url}
+                self.logger.warning("Starting URL %s not found in pending_match_counts when adding %s. Initializing.", starting_url, match_url)
+            self.pending_match_counts[starting_url] += 1
+            self.logger.debug("Added %s to pending requests for %s. Current count: %s", match_url, starting_url, self.pending_match_counts[starting_url])
 
 
-            self.logger.info(f"Queueing match link for details: {match_url}")
+            self.logger.info("Queueing match link for details: %s", match_url)
             yield scrapy.Request(
                 url=match_url,
                 callback=self.parse_match_details,
+                errback=self.errback_match_details, # Closes the handed-over page if the request fails
                 meta={
                     'match_url': match_url,
                     'starting_url': starting_url, # Pass starting_url along
                     'attendance_summary': attendance_summary,
                     'playwright': True,
                     'playwright_include_page': True,
+                    'playwright_context': 'default',
                     'playwright_page_methods': [], # Interactions handled in callback
                 }
             )
 
-        self.logger.info(f"Finished parsing schedule page {response.url}. Processed {found_count} valid match entries and queued detail requests.")
+        self.logger.info("Finished parsing schedule page %s. Processed %s valid match entries and queued detail requests.", response.url, found_count)
         # Note: We don't check for completion here, it happens in parse_match_details' finally block
 
     async def parse_match_details(self, response):
         """
         Parse the details page for a specific match, including Playwright interactions for telemetry.
+        Yields a MatchItem, which MatchJsonWriterPipeline saves to the output directory.
         Handles removing the match_url from tracking and updating the DB if it's the last one for a starting_url.
         """
         match_url = response.meta.get('match_url', response.url)
@@ -223,47 +459,46 @@ class ScheduleSpider(scrapy.Spider):
         attendance_summary = response.meta.get('attendance_summary')
 
         if not starting_url:
-            self.logger.error(f"Missing 'starting_url' in meta for match details page {match_url}. Cannot track completion.")
+            self.logger.error("Missing 'starting_url' in meta for match details page %s. Cannot track completion.", match_url)
             # Optionally close page if it exists and wasn't closed by telemetry section
             if page and not page.is_closed(): await page.close()
             return # Cannot proceed with tracking logic
 
-        self.logger.info(f"Parsing match details page: {match_url} (Originating from: {starting_url})")
+        self.logger.info("Parsing match details page: %s (Originating from: %s)", match_url, starting_url)
 
         try:
             # SECTION 1: MATCH METADATA (Extracted from initial Scrapy response)
-            self.logger.info(f"Scraping match metadata from: {response.url}")
-            match_info_xpath = ".//div[contains(@class, 'mt-[1px]') and contains(@class, 'flex') and contains(@class, 'w-full') and contains(@class, 'flex-col') and contains(@class, 'justify-center') and contains(@class, 'bg-[#621968cc]') and contains(@class, 'px-7') and contains(@class, 'py-4') and contains(@class, 'text-center') and contains(@class, 'text-sm') and contains(@class, 'text-white') and contains(@class, 'first:rounded-t-lg') and contains(@class, 'last:rounded-b-lg') and contains(@class, 'theme-m2e:bg-darkblue10/80')]"
-            match_info_element = response.xpath(match_info_xpath)
+            self.logger.info("Scraping match metadata from: %s", response.url)
+            root = response.selector.root # lxml tree already parsed by Scrapy; queried with the precompiled XPaths
+            page_divs = self._collect_page_divs(root) # One document walk for sections 1-4; later queries stay inside these divs
+            match_info_element = page_divs['match_info']
 
-            officials_xpath = ".//div[contains(@class, 'mt-[1px]') and contains(@class, 'flex') and contains(@class, 'w-full') and contains(@class, 'justify-center') and contains(@class, 'bg-[#3b0f3fcc]') and contains(@class, 'px-7') and contains(@class, 'py-4') and contains(@class, 'text-center') and contains(@class, 'text-sm') and contains(@class, 'text-white') and contains(@class, 'theme-m2e:bg-darkblue6/80')]"
-            officials_element = response.xpath(officials_xpath)
+            officials_element = page_divs['officials']
             referee, track_commissioner = None, None
             if officials_element:
-                referee = "".join(officials_element.xpath(".//div[1]/p[2]/text()").getall()).replace("  ", " ").strip()
-                track_commissioner = "".join(officials_element.xpath(".//div[2]/p[2]/text()").getall()).replace("  ", " ").strip()
+                referee = "".join(_xpath_all(self.REFEREE_TEXT_XPATH, officials_element)).replace("  ", " ").strip()
+                track_commissioner = "".join(_xpath_all(self.TRACK_COMMISSIONER_TEXT_XPATH, officials_element)).replace("  ", " ").strip()
 
-            arena_xpath = ".//div[contains(@class, 'mt-[1px]') and contains(@class, 'flex') and contains(@class, 'w-full') and contains(@class, 'flex-col') and contains(@class, 'justify-center') and contains(@class, 'bg-[#3b0f3fcc]') and contains(@class, 'px-7') and contains(@class, 'py-4') and contains(@class, 'text-center') and contains(@class, 'text-sm') and contains(@class, 'text-white') and contains(@class, 'theme-m2e:bg-darkblue6/80') and not(./div)]"
-            arena_element = response.xpath(arena_xpath)
-            arena = "".join(arena_element.xpath(".//p/text()").getall()).replace("  -  ", "").strip() if arena_element else None
+            arena_element = page_divs['arena']
+            arena = "".join(_xpath_all(self.ARENA_TEXT_XPATH, arena_element)).replace("  -  ", "").strip() if arena_element else None
 
             competition, round_type, round_info, match_date = None, None, None, None
             if match_info_element:
-                competition = (match_info_element.xpath(".//p[@class='pb-1 font-semibold uppercase']/text()").get() or "").strip()
-                round_type = (match_info_element.xpath(".//p[2]/text()").get() or "").strip()
-                round_text_nodes = match_info_element.xpath(".//p[3]/text()").getall()
-                match_date = (match_info_element.xpath(".//p[4]/text()").get() or "").strip()
+                competition = _xpath_first(self.COMPETITION_TEXT_XPATH, match_info_element, "").strip()
+                round_type = _xpath_first(self.ROUND_TYPE_TEXT_XPATH, match_info_element, "").strip()
+                round_text_nodes = _xpath_all(self.ROUND_TEXT_XPATH, match_info_element)
+                match_date = _xpath_first(self.MATCH_DATE_TEXT_XPATH, match_info_element, "").strip()
                 for text in round_text_nodes:
                     cleaned_text = text.strip()
                     if cleaned_text:
-                        round_match = re.search(r'(\d+)', cleaned_text)
+                        round_match = self.ROUND_NUMBER_RE.search(cleaned_text)
                         if round_match:
                             round_number = round_match.group(1)
                             round_info = f"Round {round_number}"
                             break
             
             # SECTION 2: TEAMS AND SCORES
-            team_name_elements = response.css('div.text-center.font-kallisto.text-sm::text').getall()
+            team_name_elements = _xpath_all(self.DIRECT_TEXT_XPATH, page_divs['team_name'])
             if len(team_name_elements) > 2:
                 home_team_details = team_name_elements[0].strip()
                 away_team_details = team_name_elements[2].strip()
@@ -273,7 +508,7 @@ class ScheduleSpider(scrapy.Spider):
             else:
                 home_team_details, away_team_details = None, None
 
-            score_elements = response.css('div.my-2\\.5.box-content.w-20.rounded-lg.bg-green1::text').getall()
+            score_elements = _xpath_all(self.DIRECT_TEXT_XPATH, page_divs['score'])
             if len(score_elements) > 2:
                 home_score_details = score_elements[0].strip()
                 away_score_details = score_elements[2].strip()
@@ -284,106 +519,109 @@ class ScheduleSpider(scrapy.Spider):
                 home_score_details, away_score_details = None, None
 
             # SECTION 3: TEAM LINEUPS
-            self.logger.info(f"Extracting team lineups from: {match_url}")
-            team_lineups_container = response.css('div.flex.basis-3\\/4.flex-col.flex-wrap.gap-7.xl\\:flex-row')
+            self.logger.info("Extracting team lineups from: %s", match_url)
+            team_lineups_container = page_divs['lineups_container']
             team1_data = {}
             team2_data = {}
 
             if team_lineups_container:
-                team_elements = team_lineups_container.css('div.mb-5.w-full.max-w-full.xl\\:mb-0.xl\\:max-w-\\[calc\\(50\\%_\\-_14px\\)\\]')
+                team_elements = _xpath_all(self.LINEUP_TEAM_XPATH, team_lineups_container)
                 if len(team_elements) >= 2:
                     team1_el, team2_el = team_elements[0], team_elements[1]
 
                     for team_el, team_data_dict in [(team1_el, team1_data), (team2_el, team2_data)]:
-                        team_data_dict['team_name'] = (team_el.css('div.truncate.max-w-\\[calc\\(100\\%_\\-_50px\\)\\]::text').get() or "").strip()
+                        team_data_dict['team_name'] = _xpath_first(self.LINEUP_TEAM_NAME_TEXT_XPATH, [team_el], "").strip()
                         
-                        team_info_staff = team_el.css('div.mb-4.mt-4.flex.flex-col.justify-end.text-sm.text-white')
-                        spans = team_info_staff.xpath(".//span[@class='text-right']")
+                        team_info_staff = self.LINEUP_STAFF_XPATH(team_el)
+                        spans = _xpath_all(self.LINEUP_STAFF_SPAN_XPATH, team_info_staff)
                         num_spans = len(spans)
                         
-                        team_data_dict['manager'] = spans[0].xpath("string()").get().split(':')[-1].strip() if num_spans > 0 and ':' in spans[0].xpath("string()").get() else None
+                        team_data_dict['manager'] = _staff_name(spans[0]) if num_spans > 0 else None
                         if num_spans == 3:
-                            team_data_dict['coach'] = spans[1].xpath("string()").get().split(':')[-1].strip() if ':' in spans[1].xpath("string()").get() else None
-                            team_data_dict['head_of_team'] = spans[2].xpath("string()").get().split(':')[-1].strip() if ':' in spans[2].xpath("string()").get() else None
+                            team_data_dict['coach'] = _staff_name(spans[1])
+                            team_data_dict['head_of_team'] = _staff_name(spans[2])
                         elif num_spans == 2:
                             team_data_dict['coach'] = None
-                            team_data_dict['head_of_team'] = spans[1].xpath("string()").get().split(':')[-1].strip() if ':' in spans[1].xpath("string()").get() else None
+                            team_data_dict['head_of_team'] = _staff_name(spans[1])
                         else: # num_spans <= 1 or unexpected
                             team_data_dict['coach'] = None
                             team_data_dict['head_of_team'] = None
 
                         riders_list = []
-                        rows = team_el.css('table.w-full.text-white tbody tr')
+                        rows = self.LINEUP_RIDER_ROW_XPATH(team_el)
                         for row in rows:
                             rider_data = {}
-                            rider_data['number'] = (row.css('td.text-center::text').get() or "").replace('.', '').strip()
-                            name_parts = row.css('td a span.inline-block::text').getall()
-                            first_name = name_parts[0].strip() if name_parts else ""
-                            last_name = (row.css('td a span.inline-block span.uppercase::text').get() or "").strip()
+                            rider_data['number'] = _xpath_first(self.LINEUP_RIDER_NUMBER_TEXT_XPATH, [row], "").replace('.', '').strip()
+                            first_name = _xpath_first(self.LINEUP_RIDER_FIRST_NAME_TEXT_XPATH, [row], "").strip()
+                            last_name = _xpath_first(self.LINEUP_RIDER_LAST_NAME_TEXT_XPATH, [row], "").strip()
                             rider_data['name'] = f"{first_name} {last_name}".strip()
-                            rider_data['scores'] = ["".join(row.css(f'td.text-center:nth-child({i}) *::text').getall()).strip() or "" for i in range(3, 9)]
-                            rider_data['sum'] = (row.css('td.text-center.text-green1 strong::text').get() or "").strip()
-                            rider_data['bonus'] = (row.css('td.text-center:last-child::text').get() or "").strip()
+                            scores = [""] * self.LINEUP_RIDER_SCORE_COLUMNS
+                            for i, cell in enumerate(self.LINEUP_RIDER_SCORE_CELLS_XPATH(row)):
+                                if cell.tag == 'td' and 'text-center' in cell.get('class', '').split():
+                                    scores[i] = "".join(self.LINEUP_RIDER_SCORE_CELL_TEXT_XPATH(cell)).strip()
+                            rider_data['scores'] = scores
+                            rider_data['sum'] = _xpath_first(self.LINEUP_RIDER_SUM_TEXT_XPATH, [row], "").strip()
+                            rider_data['bonus'] = _xpath_first(self.LINEUP_RIDER_BONUS_TEXT_XPATH, [row], "").strip()
                             riders_list.append(rider_data)
                         team_data_dict['riders'] = riders_list
                 else:
-                    self.logger.warning(f"Could not find two team elements for lineups on {match_url}")
+                    self.logger.warning("Could not find two team elements for lineups on %s", match_url)
                     team1_data, team2_data = None, None
             else:
-                self.logger.warning(f"No team lineups container found on {match_url}")
+                self.logger.warning("No team lineups container found on %s", match_url)
                 team1_data, team2_data = None, None
 
             # SECTION 4: HEAT-BY-HEAT RESULTS
-            self.logger.info(f"Extracting heat-by-heat results from: {match_url}")
+            self.logger.info("Extracting heat-by-heat results from: %s", match_url)
             all_heats_data = []
-            race_blocks = response.css('div.mx-auto.mb-5.max-w-\\[520px\\]')
+            race_blocks = page_divs['heat_block']
 
             if not race_blocks:
-                self.logger.warning(f"No race blocks found on {match_url}. Heat details might be incomplete.")
+                self.logger.warning("No race blocks found on %s. Heat details might be incomplete.", match_url)
             else:
-                self.logger.info(f"Found {len(race_blocks)} race blocks on {match_url}")
+                self.logger.info("Found %s race blocks on %s", len(race_blocks), match_url)
                 for block in race_blocks:
                     heat_data = {}
-                    heat_number_xpath = './/div[contains(@class, "mb-2.5")]//text()'
-                    heat_text_nodes = block.xpath(heat_number_xpath).getall()
+                    heat_text_nodes = self.HEAT_NUMBER_TEXT_XPATH(block)
                     heat_number = next((text.strip() for text in reversed(heat_text_nodes) if text.strip().isdigit()), None)
 
                     if not heat_number:
-                        self.logger.warning(f"Could not extract heat number using XPath: {heat_number_xpath} in block. Skipping heat.")
+                        self.logger.warning("Could not extract heat number using XPath: %s in block. Skipping heat.", self.HEAT_NUMBER_XPATH_EXPR)
                         continue
                     heat_data['heat_number'] = heat_number
 
-                    team_scores_xpath = './/td[contains(@class, "box-content") and contains(@class, "w-6") and contains(@class, "text-center") and contains(@class, "font-kallisto") and contains(@class, "lg:w-12") and @rowspan="2"]'
-                    score_elements = block.xpath(team_scores_xpath)
+                    score_elements = self.HEAT_TEAM_SCORE_XPATH(block)
                     if len(score_elements) == 4:
-                        heat_data['hometeam_heat_score'] = (score_elements[0].xpath('./text()').get() or "").strip()
-                        heat_data['awayteam_heat_score'] = (score_elements[1].xpath('./text()').get() or "").strip()
-                        heat_data['hometeam_current_match_score'] = (score_elements[2].xpath('./text()').get() or "").strip()
-                        heat_data['awayteam_current_match_score'] = (score_elements[3].xpath('./text()').get() or "").strip()
+                        heat_data['hometeam_heat_score'] = self.FIRST_TEXT_XPATH(score_elements[0]).strip()
+                        heat_data['awayteam_heat_score'] = self.FIRST_TEXT_XPATH(score_elements[1]).strip()
+                        heat_data['hometeam_current_match_score'] = self.FIRST_TEXT_XPATH(score_elements[2]).strip()
+                        heat_data['awayteam_current_match_score'] = self.FIRST_TEXT_XPATH(score_elements[3]).strip()
                     else:
-                        self.logger.warning(f"Could not extract all team scores for heat {heat_number}")
+                        self.logger.warning("Could not extract all team scores for heat %s", heat_number)
                         heat_data.update({k: None for k in ['hometeam_heat_score', 'awayteam_heat_score', 'hometeam_current_match_score', 'awayteam_current_match_score']})
 
                     riders_in_heat = []
-                    rows = block.xpath('.//tbody/tr')
+                    rows = self.HEAT_ROWS_XPATH(block)
                     for row_idx, row in enumerate(rows):
                         try:
-                            starting_field = (row.xpath('./td[1]/text()').get() or "").strip()
-                            rider_div = row.xpath('./td[3]')
-                            rider = (rider_div.xpath('normalize-space(./div[not(contains(@class, "line-through"))])').get() or "").strip()
-                            substituted_rider = (rider_div.xpath('normalize-space(./div[contains(@class, "line-through")])').get() or "").strip() or None
+                            (starting_field, helmet_color_class, rider, substituted_rider,
+                             rider_score, warning) = self.HEAT_RIDER_FIELDS_XPATH(row).split(self.HEAT_RIDER_FIELD_SEPARATOR)
+                            starting_field = starting_field.strip()
+                            substituted_rider = substituted_rider or None
                             
-                            helmet_color_class = row.xpath('./td[1]/@class').get()
                             helmet_color = None
-                            if helmet_color_class and "!bg-" in helmet_color_class:
-                                color_part = helmet_color_class.split("!bg-")[-1].lower()
-                                if "red" in color_part: helmet_color = "red"
-                                elif "white" in color_part: helmet_color = "white"
-                                elif "blue" in color_part: helmet_color = "blue"
-                                elif "yellow" in color_part: helmet_color = "yellow"
+                            _, bg_marker, color_part = helmet_color_class.rpartition("!bg-")
+                            if bg_marker:
+                                color_part = color_part.lower()
+                                helmet_color = self.HELMET_COLORS.get(color_part)
+                                if helmet_color is None:
+                                    if "red" in color_part: helmet_color = "red"
+                                    elif "white" in color_part: helmet_color = "white"
+                                    elif "blue" in color_part: helmet_color = "blue"
+                                    elif "yellow" in color_part: helmet_color = "yellow"
                             
-                            rider_score = (row.xpath('./td[4]/text()').get() or "").strip()
-                            warning = (row.xpath('./td[contains(@class, "box-content") and contains(@class, "w-3") and contains(@class, "text-center")]//span/text()').get() or "").strip() or None
+                            rider_score = rider_score.strip()
+                            warning = warning.strip() or None
                             
                             riders_in_heat.append({
                                 'starting_field': starting_field, 'helmet_color': helmet_color,
@@ -391,79 +629,65 @@ class ScheduleSpider(scrapy.Spider):
                                 'rider_score': rider_score, 'warning': warning,
                             })
                         except Exception as e:
-                            self.logger.error(f"Error extracting rider data in heat {heat_number}, row {row_idx}: {e}")
+                            self.logger.error("Error extracting rider data in heat %s, row %s: %s", heat_number, row_idx, e)
                     heat_data['riders'] = riders_in_heat
                     all_heats_data.append(heat_data)
 
             # SECTION 5: TELEMETRY DATA (requires browser automation)
-            main_telemetry_data = "Telemetry data not processed (Playwright page not available or error)."
+            # Without telemetry, telemetry_data is {"error": ..., "data": []} rather than a bare message string
+            main_telemetry_data = {"error": "Telemetry data not processed (Playwright page not available or error).", "data": []}
             if not page:
                 self.logger.error("Playwright page object not found in meta. Cannot scrape telemetry data.")
             else:
-                self.logger.info(f"Starting Playwright interaction for telemetry data on: {match_url}")
+                self.logger.info("Starting Playwright interaction for telemetry data on: %s", match_url)
                 try:
-                    # *** OPTIMIZATION: Resource Blocking - Test thoroughly! ***
-                    # Block images, stylesheets, and fonts to potentially speed up Playwright interactions.
-                    # If telemetry interactions break, remove or refine this blocking.
-                    await page.route(
-                        "**/*",
-                        lambda route: route.abort()
-                        if route.request.resource_type in ["image", "stylesheet", "font", "media"] # Keep "script", "xhr", "fetch" etc.
-                        else route.continue_()
-                    )
-                    self.logger.info("Applied Playwright resource blocking (images, stylesheets, fonts, media).")
+                    # Resource blocking (images, fonts, media, trackers) is applied by scrapy-playwright
+                    # to every page from navigation on, via PLAYWRIGHT_ABORT_REQUEST (see update_settings).
 
                     # *** EFFICIENCY CHANGE: Removed redundant page.goto() ***
                     # The page is already at response.url due to scrapy-playwright.
-                    # self.logger.info(f"Navigating page to {response.url} before telemetry interaction...")
+                    # self.logger.info("Navigating page to %s before telemetry interaction...", response.url)
                     # await page.goto(response.url, wait_until="domcontentloaded", timeout=60000) # REMOVED
                     # self.logger.info("Page was already navigated by scrapy-playwright.")
 
                     stable_element_selector = 'div.flex.basis-3\\/4.flex-col.flex-wrap.gap-7.xl\\:flex-row' # e.g., team lineups
-                    self.logger.info(f"Waiting for stable element '{stable_element_selector}' to ensure page is ready for telemetry.")
+                    self.logger.info("Waiting for stable element '%s' to ensure page is ready for telemetry.", stable_element_selector)
                     await page.wait_for_selector(stable_element_selector, state='visible', timeout=30000)
                     self.logger.info("Stable element found.")
 
                     telemetry_button_selector = 'a:has(span.short-name:has-text("Telemetry"))'
-                    self.logger.info(f"Waiting for telemetry tab button to be visible: {telemetry_button_selector}")
+                    self.logger.info("Waiting for telemetry tab button to be visible: %s", telemetry_button_selector)
                     telemetry_button = await page.wait_for_selector(telemetry_button_selector, state='visible', timeout=30000) # Long timeout for initial visibility
                     
-                    self.logger.info(f"Attempting to click telemetry tab button: {telemetry_button_selector}")
+                    self.logger.info("Attempting to click telemetry tab button: %s", telemetry_button_selector)
                     await telemetry_button.click(timeout=10000) # Shorter timeout for the click action itself
                     self.logger.info("Telemetry tab clicked.")
 
                     main_telemetry_table_selector = 'table.w-full.table-auto.overflow-x-auto'
                     # *** EFFICIENCY CHANGE: Wait for table visibility after click, instead of fixed delay ***
-                    self.logger.info(f"Waiting for main telemetry table to load: {main_telemetry_table_selector}")
+                    self.logger.info("Waiting for main telemetry table to load: %s", main_telemetry_table_selector)
                     await page.wait_for_selector(main_telemetry_table_selector, state='visible', timeout=90000)
                     self.logger.info("Main telemetry table loaded successfully.")
 
-                    rider_row_handles = await page.query_selector_all(f"{main_telemetry_table_selector} tbody tr")
-                    self.logger.info(f"Found {len(rider_row_handles)} potential rider rows in telemetry table.")
+                    rider_rows_selector = f"{main_telemetry_table_selector} tbody tr"
+                    rider_row_summaries = await page.eval_on_selector_all(rider_rows_selector, self.TELEMETRY_ROW_SUMMARY_JS)
+                    rider_row_handles = await page.query_selector_all(rider_rows_selector)
+                    self.logger.info("Found %s potential rider rows in telemetry table.", len(rider_row_handles))
+                    # Look up every row's expand button at once; the CDP round-trips overlap instead of running one per row
+                    button_handles = await asyncio.gather(*(row_handle.query_selector('td:first-child button') for row_handle in rider_row_handles))
                     
                     processed_telemetry_data = []
 
-                    for i, row_handle in enumerate(rider_row_handles):
-                        if await row_handle.query_selector('td[colspan="6"]'): # Skip expanded sub-table rows
-                            self.logger.debug(f"Skipping row {i} as it appears to be an expanded sub-table row.")
+                    for i, (row_handle, row_summary, button_handle) in enumerate(zip(rider_row_handles, rider_row_summaries, button_handles)):
+                        if row_summary is None: # Skip expanded sub-table rows
+                            self.logger.debug("Skipping row %s as it appears to be an expanded sub-table row.", i)
                             continue
 
-                        rider_name, rider_number = f'Unknown Rider Row {i}', 'N/A'
-                        try:
-                            rider_number_el = await row_handle.query_selector('td:nth-child(2)')
-                            team_code_el = await row_handle.query_selector('td:nth-child(3)')
-                            rider_name_el = await row_handle.query_selector('td:nth-child(4)')
-                            best_time_el = await row_handle.query_selector('td:nth-child(5)')
-                            vmax_summary_el = await row_handle.query_selector('td:nth-child(6)')
-
-                            rider_number = (await rider_number_el.inner_text()).strip() if rider_number_el else 'N/A'
-                            team_code = (await team_code_el.inner_text()).strip() if team_code_el else 'N/A'
-                            rider_name = (await rider_name_el.inner_text()).strip() if rider_name_el else f'Unnamed Rider Row {i}'
-                            best_time = (await best_time_el.inner_text()).strip() if best_time_el else 'N/A'
-                            vmax_summary = (await vmax_summary_el.inner_text()).strip() if vmax_summary_el else 'N/A'
-                        except Exception as e_basic:
-                            self.logger.warning(f"Could not extract basic telemetry info for rider in row {i}: {e_basic}. Using placeholders.")
-                            # Basic data entry will be created anyway with placeholders
+                        rider_number = _value_or(row_summary['rider_number'], 'N/A')
+                        team_code = sys.intern(_value_or(row_summary['team_code'], 'N/A')) # Two values per match; interned so all riders share one object
+                        rider_name = _value_or(row_summary['rider_name'], f'Unnamed Rider Row {i}')
+                        best_time = _value_or(row_summary['best_time'], 'N/A')
+                        vmax_summary = _value_or(row_summary['vmax_summary'], 'N/A')
                         
                         rider_name_for_log = rider_name if rider_name != f'Unnamed Rider Row {i}' else f"Rider at index {i}"
                         basic_data_entry = {
@@ -471,74 +695,75 @@ class ScheduleSpider(scrapy.Spider):
                             'best_time': best_time, 'vmax_summary': vmax_summary, 'detailed_telemetry': []
                         }
 
-                        button_handle = await row_handle.query_selector('td:first-child button')
                         if not button_handle:
-                            self.logger.warning(f"No expand button for rider {rider_name_for_log}. No detailed telemetry.")
+                            self.logger.warning("No expand button for rider %s. No detailed telemetry.", rider_name_for_log)
                             processed_telemetry_data.append(basic_data_entry)
                             continue
 
                         sub_table_row_handle = None # Initialize for finally block
                         try:
-                            self.logger.info(f"Expanding details for rider {rider_name_for_log} (#{rider_number})")
+                            self.logger.info("Expanding details for rider %s (#%s)", rider_name_for_log, rider_number)
                             await button_handle.click(timeout=10000)
 
                             sub_table_row_selector = "xpath=./following-sibling::tr[1][.//table]" # Relative to row_handle
                             sub_table_row_handle = await row_handle.wait_for_selector(sub_table_row_selector, state="visible", timeout=10000)
-                            
+                        
                             if sub_table_row_handle:
                                 sub_table_handle = await sub_table_row_handle.query_selector('table')
                                 if sub_table_handle:
-                                    sub_table_html = await sub_table_handle.inner_html()
-                                    sub_table_response = HtmlResponse(page.url, body=sub_table_html, encoding='utf-8')
-                                    sub_table_rows_data = sub_table_response.css('tbody tr')
-                                    for sub_row in sub_table_rows_data:
-                                        detailed_data = {
-                                            'heat_number': (sub_row.css('td:nth-child(1)::text').get() or '').strip(),
-                                            'lap_time': (sub_row.css('td:nth-child(2)::text').get() or '').strip(),
-                                            'distance': (sub_row.css('td:nth-child(3)::text').get() or '').strip(),
-                                            'vmax_lap': (sub_row.css('td:nth-child(4)::text').get() or '').strip(),
-                                            'lap1_time': (sub_row.css('td:nth-child(5)::text').get() or '').strip(),
-                                            'lap2_time': (sub_row.css('td:nth-child(6)::text').get() or '').strip(),
-                                            'lap3_time': (sub_row.css('td:nth-child(7)::text').get() or '').strip(),
-                                            'lap4_time': (sub_row.css('td:nth-child(8)::text').get() or '').strip(),
-                                        }
-                                        basic_data_entry['detailed_telemetry'].append(detailed_data)
-                                    self.logger.debug(f"Extracted {len(basic_data_entry['detailed_telemetry'])} detailed entries for {rider_name_for_log}")
+                                    detail_keys = self.TELEMETRY_DETAIL_KEYS
+                                    sub_table_rows_cells = await sub_table_handle.eval_on_selector_all('tbody tr', self.TELEMETRY_SUB_ROW_CELLS_JS, len(detail_keys))
+                                    # The heat number recurs for every rider in the heat, so it is interned
+                                    basic_data_entry['detailed_telemetry'] = [
+                                        dict(zip(detail_keys, (sys.intern(heat_number), *other_cells)))
+                                        for heat_number, *other_cells in sub_table_rows_cells
+                                    ]
+                                    self.logger.debug("Extracted %s detailed entries for %s", len(basic_data_entry['detailed_telemetry']), rider_name_for_log)
                                 else: # No inner table in sub_table_row_handle
-                                    self.logger.warning(f"Could not find inner table for rider {rider_name_for_log}.")
+                                    self.logger.warning("Could not find inner table for rider %s.", rider_name_for_log)
                             else: # sub_table_row_handle not found
-                                 self.logger.warning(f"Sub-table row not found for rider {rider_name_for_log} after clicking expand.")
+                                 self.logger.warning("Sub-table row not found for rider %s after clicking expand.", rider_name_for_log)
                         
                         except Exception as e_detail:
-                            self.logger.error(f"Error processing detailed telemetry for {rider_name_for_log}: {e_detail}")
+                            self.logger.error("Error processing detailed telemetry for %s: %s", rider_name_for_log, e_detail)
                         finally:
-                            # Attempt to close the sub-table if it was opened or if an error occurred
-                            if button_handle and await button_handle.is_visible():
+                            # Attempt to close the sub-table if it was opened or if an error occurred.
+                            # Skipped unless TELEMETRY_COLLAPSE_ROWS is set: the page is closed right after telemetry, so nothing reads the collapsed state.
+                            if self.TELEMETRY_COLLAPSE_ROWS and button_handle:
                                 try:
                                     # Check if the button's state suggests it's expanded (might need specific attribute check)
-                                    # For now, just click if visible, assuming it might be expanded
-                                    self.logger.debug(f"Attempting to close/reset expand button for {rider_name_for_log}")
-                                    await button_handle.click(timeout=5000) 
-                                    if sub_table_row_handle and await sub_table_row_handle.is_visible():
+                                    # For now, just click, assuming it might be expanded. No is_visible() pre-check: click already
+                                    # fails on a hidden or detached button, and the short timeout bounds that case.
+                                    self.logger.debug("Attempting to close/reset expand button for %s", rider_name_for_log)
+                                    await button_handle.click(timeout=2000)
+                                except Exception as e_close_click:
+                                    self.logger.warning("Error clicking to close button for %s: %s", rider_name_for_log, e_close_click)
+                                else:
+                                    if sub_table_row_handle:
                                         try:
-                                            # *** EFFICIENCY CHANGE: Wait for sub-table to hide ***
+                                            # *** EFFICIENCY CHANGE: Wait for sub-table to hide *** (returns at once if already hidden)
                                             await sub_table_row_handle.wait_for_element_state("hidden", timeout=5000)
-                                            self.logger.info(f"Closed and confirmed hidden sub-table for {rider_name_for_log}")
+                                            self.logger.info("Closed and confirmed hidden sub-table for %s", rider_name_for_log)
                                         except Exception as e_hide_wait:
-                                            self.logger.warning(f"Sub-table for {rider_name_for_log} did not confirm hidden quickly: {e_hide_wait}. Using small delay.")
-                                            await page.wait_for_timeout(150) # Small fallback delay
+                                            self.logger.warning("Sub-table for %s did not confirm hidden quickly: %s. Waiting briefly for it to go.", rider_name_for_log, e_hide_wait)
+                                            try:
+                                                # Small fallback wait: returns on the mutation that removes or hides the row
+                                                row_gone = await page.evaluate(self.TELEMETRY_ROW_GONE_WAIT_JS, [sub_table_row_handle, self.TELEMETRY_ROW_GONE_WAIT_MS])
+                                            except Exception as e_gone_wait:
+                                                self.logger.warning("Could not wait for the sub-table of %s to go: %s", rider_name_for_log, e_gone_wait)
+                                            else:
+                                                if not row_gone:
+                                                    self.logger.warning("Sub-table for %s still shown after %s ms.", rider_name_for_log, self.TELEMETRY_ROW_GONE_WAIT_MS)
                                     else:
-                                        # If sub_table_row_handle wasn't found or already hidden, just log that we clicked close
-                                        self.logger.info(f"Clicked to close/reset details for {rider_name_for_log} (sub-table might not have been open or already hidden).")
-                                except Exception as e_close_click:
-                                    self.logger.warning(f"Error clicking to close button for {rider_name_for_log}: {e_close_click}")
+                                        # If sub_table_row_handle wasn't found, just log that we clicked close
+                                        self.logger.info("Clicked to close/reset details for %s (sub-table might not have been open).", rider_name_for_log)
                             processed_telemetry_data.append(basic_data_entry)
                     
                     main_telemetry_data = processed_telemetry_data
 
                 except Exception as e_telemetry_main:
-                    self.logger.error(f"Major error during telemetry tab processing for {match_url}: {e_telemetry_main}")
-                    main_telemetry_data = f"Telemetry tab/data not accessible: {e_telemetry_main}"
+                    self.logger.error("Major error during telemetry tab processing for %s: %s", match_url, e_telemetry_main)
+                    main_telemetry_data = {"error": f"Telemetry tab/data not accessible: {e_telemetry_main!r}", "data": []}
                 finally:
                     # Scrapy-Playwright handles page and context closure based on settings.
                     # However, if you explicitly took control (which we did by getting `page`),
@@ -550,85 +775,76 @@ class ScheduleSpider(scrapy.Spider):
                         # self.logger.info("Playwright page closed by spider.")
 
             # SECTION 6: COMPILE AND RETURN FINAL RESULT
-            match_data = {
-                'source': 'match_details_aggregated_with_telemetry', 'match_url': match_url,
-                'competition': competition, 'round_type': round_type, 'round': round_info, 'match_date': match_date,
-                'attendance_summary': attendance_summary, 'referee': referee, 'track_commissioner': track_commissioner, 'arena': arena,
-                'home_team_details': home_team_details, 'home_score_details': home_score_details,
-                'away_team_details': away_team_details, 'away_score_details': away_score_details, # Corrected away_score_details
-                'team1': team1_data if team1_data else "Not available",
-                'team2': team2_data if team2_data else "Not available",
-                'match_details': all_heats_data,
-                'telemetry_data': main_telemetry_data
-            }
-
-            self.logger.info(f"Completed scraping match: {match_url}")
-
-            # Generate filename for match data
-            home_team = match_data.get('home_team_details', 'unknown_home_team').replace(" ", "_").replace("/", "_")
-            away_team = match_data.get('away_team_details', 'unknown_away_team').replace(" ", "_").replace("/", "_")
-            date_time = match_data.get('match_date', 'unknown_date').replace(" ", "T").replace(":", "-").replace("/", "-")
-            comptetition_name = match_data.get('competition', 'unknown_competition').replace(" ", "").replace("/", "")
-            round_type_name = match_data.get('round_type', 'unknown_round_type').replace(" ", "").replace("/", "")
-
-            filename = f"output_{comptetition_name}_{round_type_name}_{home_team}-{away_team}_{date_time}.json"
-            output_path = os.path.join('output', filename) # Save in an 'output' directory
-
-            # Ensure the output directory exists
-            os.makedirs('output', exist_ok=True)
-
-            # Save the match data to a JSON file
-            try:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(match_data, f, ensure_ascii=False, indent=4)
-                self.logger.info(f"Saved match data to {output_path}")
-            except Exception as e:
-                self.logger.error(f"Failed to save match data to {output_path}: {e}")
+            # The JSON file is written by MatchJsonWriterPipeline
+            match_item = MatchItem(
+                source='match_details_aggregated_with_telemetry', match_url=match_url,
+                competition=competition, round_type=round_type, round=round_info, match_date=match_date,
+                attendance_summary=attendance_summary, referee=referee, track_commissioner=track_commissioner, arena=arena,
+                home_team_details=home_team_details, home_score_details=home_score_details,
+                away_team_details=away_team_details, away_score_details=away_score_details,
+                team1=team1_data if team1_data else "Not available",
+                team2=team2_data if team2_data else "Not available",
+                match_details=all_heats_data,
+                telemetry_data=main_telemetry_data,
+            )
+
+            self.logger.info("Completed scraping match: %s", match_url)
+            yield match_item
 
         finally:
             # This block executes regardless of success or failure in the try block above
             if starting_url and match_url: # Ensure we have the keys needed
-                if starting_url in self.pending_match_requests:
-                    try:
-                        self.pending_match_requests[starting_url].remove(match_url)
-                        self.logger.debug(f"Removed completed/failed {match_url} from pending for {starting_url}. Remaining: {len(self.pending_match_requests[starting_url])}")
+                remaining = self.pending_match_counts.get(starting_url) # None if the starting URL is not tracked
+                if remaining is not None:
+                    if remaining > 0:
+                        remaining -= 1
+                        self.pending_match_counts[starting_url] = remaining
+                        self.logger.debug("Removed completed/failed %s from pending for %s. Remaining: %s", match_url, starting_url, remaining)
 
                         # Check if this was the last pending request for the starting_url
-                        if not self.pending_match_requests[starting_url]:
-                            self.logger.info(f"All match requests completed for starting URL: {starting_url}")
+                        if remaining == 0:
+                            self.logger.info("All match requests completed for starting URL: %s", starting_url)
                             is_current = self.start_url_meta.get(starting_url, None) # Get is_current_season flag
 
                             if is_current is False: # Explicitly check for False, not None
                                 if self.cursor and self.conn:
-                                    try:
-                                        self.logger.info(f"Updating database: Setting is_scraped=true for non-current season URL: {starting_url}")
-                                        self.cursor.execute("UPDATE public.data_source SET is_scraped = true WHERE url = %s", (starting_url,))
-                                        self.conn.commit()
-                                        self.logger.info(f"Successfully marked {starting_url} as scraped in the database.")
-                                    except psycopg2.Error as e:
-                                        self.logger.error(f"Database error updating is_scraped for {starting_url}: {e}")
-                                        # Optionally rollback if needed, though commit handles one statement
-                                        # self.conn.rollback()
+                                    self.logger.info("Queueing database update: Setting is_scraped=true for non-current season URL: %s", starting_url)
+                                    self._queue_starting_url_scraped(starting_url)
                                 else:
-                                    self.logger.error(f"Cannot update is_scraped for {starting_url}: Database connection not available.")
+                                    self.logger.error("Cannot update is_scraped for %s: Database connection not available.", starting_url)
                             elif is_current is True:
-                                self.logger.info(f"Skipping database update for {starting_url} because it is marked as current season.")
+                                self.logger.info("Skipping database update for %s because it is marked as current season.", starting_url)
                             else: # is_current is None (shouldn't happen if start_requests worked)
-                                self.logger.warning(f"Could not determine if {starting_url} is current season. Cannot update database status.")
+                                self.logger.warning("Could not determine if %s is current season. Cannot update database status.", starting_url)
 
                             # Optional: Clean up memory for completed starting_url
-                            # del self.pending_match_requests[starting_url]
+                            # del self.pending_match_counts[starting_url]
                             # del self.start_url_meta[starting_url]
 
-                    except KeyError:
-                        self.logger.warning(f"Match URL {match_url} was not found in the pending set for {starting_url} during finally block. Might have been processed twice or tracking error.")
+                    else:
+                        self.logger.warning("Pending count for %s was already zero when %s finished during finally block. Might have been processed twice or tracking error.", starting_url, match_url)
                 else:
-                    self.logger.warning(f"Starting URL {starting_url} not found in pending requests tracking during finally block for {match_url}.")
+                    self.logger.warning("Starting URL %s not found in pending requests tracking during finally block for %s.", starting_url, match_url)
             else:
-                 self.logger.warning(f"Could not perform completion check: missing starting_url or match_url in finally block for response {response.url}")
+                 self.logger.warning("Could not perform completion check: missing starting_url or match_url in finally block for response %s", response.url)
 
             # Ensure Playwright page is closed if it wasn't handled in the telemetry section
             # (e.g., if telemetry failed or wasn't needed)
             if page and not page.is_closed():
-                self.logger.debug(f"Closing Playwright page in finally block for {match_url}")
+                self.logger.debug("Closing Playwright page in finally block for %s", match_url)
                 await page.close()
+
+    async def errback_match_details(self, failure):
+        """
+        Handles a failed match request (download error, timeout, HTTP error).
+        Closes the Playwright page scrapy-playwright handed over via playwright_include_page, which would otherwise
+        stay open and hold one of the context's page slots. The match stays pending, so its starting URL is not
+        marked as scraped and the match is retried on the next run.
+        """
+        request = failure.request
+        match_url = request.meta.get('match_url', request.url)
+        self.logger.error("Request for match page %s failed: %r. It stays pending for its starting URL.", match_url, failure.value)
+
+        page = request.meta.get("playwright_page")
+        if page and not page.is_closed():
+            await page.close()
@@ -2,21 +2,39 @@ import os
 import json
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import execute_values
+from psycopg2.extras import execute_values, Json
 from datetime import datetime
 import logging
 import shutil
+import concurrent.futures
+import collections
+import errno
+import itertools
+import functools
+import re
+
+try:
+    import orjson # C JSON codec; optional, falls back to the stdlib json module
+except ImportError:
+    orjson = None
+
+def _json_dumps(obj):
+    """Serializes obj for the Json adapter (which expects str), with orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
 
 def parse_telemetry_value(value_str):
-    """Parses a telemetry value string (e.g., '61.843 s') into a float."""
+    """Parses a telemetry value string (e.g., '61.843 s') into a float. Numbers are passed through as floats."""
+    if isinstance(value_str, (int, float)):
+        return float(value_str)
     if not isinstance(value_str, str) or not value_str.strip():
         return None
     try:
-        # Remove units and whitespace, then convert to float
-        numeric_part = value_str.replace(' s', '').replace(' m', '').replace(' km/h', '').strip()
-        return float(numeric_part)
+        # The number is the first whitespace-separated token; the unit (s, m, km/h) follows it
+        return float(value_str.split(None, 1)[0])
     except ValueError:
-        logging.warning(f"Could not parse telemetry value: {value_str}")
+        logging.warning("Could not parse telemetry value: %s", value_str)
         return None
 
 
@@ -35,6 +53,11 @@ DB_NAME = os.environ.get('POSTGRES_DB', 'speedway_db')
 DB_USER = os.environ.get('POSTGRES_USER', 'speedway_user')
 DB_PASSWORD = os.environ.get('PGPASSWORD', 'speedgres_password')
 
+COMMIT_BATCH_SIZE = 25 # Files loaded per transaction
+MOVE_MAX_WORKERS = 2 # Threads copying processed files to another filesystem
+PARSE_PREFETCH_DEPTH = 4 # Files read and decoded ahead of the one being loaded
+EXECUTE_VALUES_PAGE_SIZE = 500 # Rows per statement of execute_values (psycopg2 defaults to 100)
+
 OUTPUT_DIR = 'output' # Relative to the script's location if it's inside speedway_scraper
 
 def get_db_connection():
@@ -44,41 +67,67 @@ def get_db_connection():
         logging.info("Successfully connected to the database.")
         return conn
     except psycopg2.Error as e:
-        logging.error(f"Error connecting to PostgreSQL Database: {e}")
+        logging.error("Error connecting to PostgreSQL Database: %s", e)
         raise
 
+# IDs resolved by get_or_create_id, keyed by (table_name, column_name, value). Lookup values repeat across files
+# (same arenas, referees, riders all season), so hits skip the SELECT entirely. Cleared on rollback, since IDs
+# inserted in a rolled-back transaction no longer exist.
+_LOOKUP_CACHE = {}
+
+# Composed SELECT/INSERT templates of get_or_create_id, keyed by (table_name, column_name, returning_id_column).
+# Composed objects are immutable, so each is built (and its identifiers quoted) once instead of on every call.
+_LOOKUP_QUERIES = {}
+
+def _lookup_queries(table_name, column_name, returning_id_column):
+    """Returns the cached (select, insert) queries of get_or_create_id for the given table and columns."""
+    key = (table_name, column_name, returning_id_column)
+    queries = _LOOKUP_QUERIES.get(key)
+    if queries is None:
+        query_select = sql.SQL("SELECT {} FROM {} WHERE {} = %s").format(
+            sql.Identifier(returning_id_column),
+            sql.Identifier(table_name),
+            sql.Identifier(column_name)
+        )
+        query_insert = sql.SQL("INSERT INTO {} ({}) VALUES (%s) ON CONFLICT ({}) DO NOTHING RETURNING {}").format(
+            sql.Identifier(table_name),
+            sql.Identifier(column_name),
+            sql.Identifier(column_name), # Conflict target
+            sql.Identifier(returning_id_column)
+        )
+        queries = _LOOKUP_QUERIES[key] = (query_select, query_insert)
+    return queries
+
 def get_or_create_id(cursor, table_name, column_name, value, returning_id_column="id"):
     """
     Generic function to get an ID if a value exists, or create a new row and return its ID.
     Assumes the table has a serial primary key named as per returning_id_column.
     Assumes the column to check for uniqueness is specified by column_name.
+    Results are memoized in _LOOKUP_CACHE.
     """
-    logging.info(f"get_or_create_id called for table: {table_name}, column: {column_name}, value type: {type(value)}, value: {value}")
+    logging.debug("get_or_create_id called for table: %s, column: %s, value type: %s, value: %s", table_name, column_name, type(value), value)
     if value is None or (isinstance(value, str) and not value.strip()):
         return None
 
-    query_select = sql.SQL("SELECT {} FROM {} WHERE {} = %s").format(
-        sql.Identifier(returning_id_column),
-        sql.Identifier(table_name),
-        sql.Identifier(column_name)
-    )
+    cache_key = (table_name, column_name, value)
+    cached_id = _LOOKUP_CACHE.get(cache_key)
+    if cached_id is not None:
+        return cached_id
+
+    query_select, query_insert = _lookup_queries(table_name, column_name, returning_id_column)
     cursor.execute(query_select, (value,))
     result = cursor.fetchone()
 
     if result:
+        _LOOKUP_CACHE[cache_key] = result[0]
         return result[0]
     else:
-        query_insert = sql.SQL("INSERT INTO {} ({}) VALUES (%s) ON CONFLICT ({}) DO NOTHING RETURNING {}").format(
-            sql.Identifier(table_name),
-            sql.Identifier(column_name),
-            sql.Identifier(column_name), # Conflict target
-            sql.Identifier(returning_id_column)
-        )
         try:
             cursor.execute(query_insert, (value,))
             # If insert was successful, fetch the ID
             inserted_id = cursor.fetchone()
             if inserted_id:
+                _LOOKUP_CACHE[cache_key] = inserted_id[0]
                 return inserted_id[0]
             else:
                  # If ON CONFLICT DO NOTHING was triggered, the RETURNING clause won't return anything.
@@ -86,15 +135,158 @@ def get_or_create_id(cursor, table_name, column_name, value, returning_id_column
                  cursor.execute(query_select, (value,))
                  result = cursor.fetchone()
                  if result:
+                     _LOOKUP_CACHE[cache_key] = result[0]
                      return result[0]
                  else:
-                     logging.error(f"Failed to get or create ID for {table_name} with value '{value}' after conflict.")
+                     logging.error("Failed to get or create ID for %s with value '%s' after conflict.", table_name, value)
                      return None # Should not happen if ON CONFLICT DO NOTHING works as expected
         except psycopg2.Error as e:
-            logging.error(f"Error during get_or_create_id insert/select for {table_name} with value '{value}': {e}")
+            logging.error("Error during get_or_create_id insert/select for %s with value '%s': %s", table_name, value, e)
             return None
 
+def get_or_create_ids(cursor, table_name, column_name, values, returning_id_column="id"):
+    """
+    Batched get_or_create_id: returns a {value: id} dict for the non-empty values. Values missing from _LOOKUP_CACHE
+    are looked up with one SELECT ... = ANY(...), and those still missing are inserted with one multi-row INSERT.
+    """
+    ids = {}
+    missing = []
+    for value in dict.fromkeys(values): # Deduplicated, in order
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        cached_id = _LOOKUP_CACHE.get((table_name, column_name, value))
+        if cached_id is not None:
+            ids[value] = cached_id
+        else:
+            missing.append(value)
+    if not missing:
+        return ids
+
+    query_select_many = sql.SQL("SELECT {}, {} FROM {} WHERE {} = ANY(%s)").format(
+        sql.Identifier(column_name),
+        sql.Identifier(returning_id_column),
+        sql.Identifier(table_name),
+        sql.Identifier(column_name)
+    )
+    cursor.execute(query_select_many, (missing,))
+    found = dict(cursor.fetchall())
 
+    to_insert = [(value,) for value in missing if value not in found]
+    if to_insert:
+        query_insert_many = sql.SQL("INSERT INTO {} ({}) VALUES %s ON CONFLICT ({}) DO NOTHING RETURNING {}, {}").format(
+            sql.Identifier(table_name),
+            sql.Identifier(column_name),
+            sql.Identifier(column_name), # Conflict target
+            sql.Identifier(column_name),
+            sql.Identifier(returning_id_column)
+        )
+        found.update(execute_values(cursor, query_insert_many, to_insert, page_size=EXECUTE_VALUES_PAGE_SIZE, fetch=True))
+        conflicted = [value for value in missing if value not in found]
+        if conflicted:
+            # ON CONFLICT DO NOTHING returns no row for these; select the existing IDs
+            cursor.execute(query_select_many, (conflicted,))
+            found.update(cursor.fetchall())
+
+    for value in missing:
+        row_id = found.get(value)
+        if row_id is None:
+            logging.error("Failed to get or create ID for %s with value '%s' after conflict.", table_name, value)
+            continue
+        _LOOKUP_CACHE[(table_name, column_name, value)] = row_id
+        ids[value] = row_id
+    return ids
+
+# Lookup tables resolved through get_or_create_id: (table_name, column_name, returning_id_column)
+LOOKUP_TABLES = (
+    ('arenas', 'name', 'arena_id'),
+    ('competitions', 'name', 'competition_id'),
+    ('referees', 'name', 'referee_id'),
+    ('track_commissioners', 'name', 'commissioner_id'),
+    ('riders', 'name', 'rider_id'),
+)
+
+def preload_lookup_cache(conn):
+    """
+    Loads every existing row of the LOOKUP_TABLES into _LOOKUP_CACHE with one SELECT per table,
+    so get_or_create_id only reaches the database for values it has not seen yet.
+    """
+    with conn.cursor() as cursor:
+        for table_name, column_name, returning_id_column in LOOKUP_TABLES:
+            query_select_all = sql.SQL("SELECT {}, {} FROM {}").format(
+                sql.Identifier(column_name),
+                sql.Identifier(returning_id_column),
+                sql.Identifier(table_name)
+            )
+            cursor.execute(query_select_all)
+            for value, row_id in cursor:
+                _LOOKUP_CACHE[(table_name, column_name, value)] = row_id
+    conn.commit() # End the read transaction, so transform_and_load can switch autocommit off for the file batches
+    logging.info("Preloaded %s lookup values into the cache.", len(_LOOKUP_CACHE))
+
+
+# Resolves a team in one round trip: an existing row is matched by team_code, else by full_name (rows saved
+# without a code), and has its missing fields filled in; only when neither matches is a new row inserted.
+# A NULL arena_id leaves the stored one unchanged.
+UPSERT_TEAM_QUERY = sql.SQL("""
+    WITH by_code AS (
+        UPDATE teams
+        SET full_name = COALESCE(full_name, %(full_name)s),
+            arena_id = COALESCE(arena_id, %(arena_id)s)
+        WHERE team_id = (SELECT team_id FROM teams WHERE team_code = %(team_code)s LIMIT 1)
+        RETURNING team_id
+    ), by_name AS (
+        UPDATE teams
+        SET team_code = COALESCE(team_code, %(team_code)s),
+            arena_id = COALESCE(arena_id, %(arena_id)s)
+        WHERE NOT EXISTS (SELECT 1 FROM by_code)
+          AND team_id = (SELECT team_id FROM teams WHERE full_name = %(full_name)s LIMIT 1)
+        RETURNING team_id
+    ), inserted AS (
+        INSERT INTO teams (team_code, full_name, arena_id)
+        SELECT %(team_code)s, %(full_name)s, %(arena_id)s
+        WHERE NOT EXISTS (SELECT 1 FROM by_code) AND NOT EXISTS (SELECT 1 FROM by_name)
+        ON CONFLICT (team_code) DO UPDATE SET
+            full_name = COALESCE(teams.full_name, EXCLUDED.full_name),
+            arena_id = COALESCE(teams.arena_id, EXCLUDED.arena_id)
+        RETURNING team_id
+    )
+    SELECT team_id FROM by_code
+    UNION ALL SELECT team_id FROM by_name
+    UNION ALL SELECT team_id FROM inserted
+    LIMIT 1
+""")
+
+def upsert_team(cursor, team_code, full_name, arena_id, side, filename):
+    """Gets or creates the team identified by team_code and/or full_name and returns its team_id."""
+    if not team_code and not full_name: # Only insert if we have at least one identifier
+        logging.warning("Cannot process %s team: neither code nor name provided in file %s.", side, filename)
+        return None
+
+    # Empty strings become NULL, so they neither match nor get stored as an identifier
+    cursor.execute(UPSERT_TEAM_QUERY, {'team_code': team_code or None, 'full_name': full_name or None, 'arena_id': arena_id})
+    result = cursor.fetchone()
+    if result is None:
+        logging.error("Failed to get or create %s team with code '%s' and name '%s'.", side, team_code, full_name)
+        return None
+    logging.info("Resolved %s team (code '%s', name '%s'), ID: %s", side, team_code, full_name, result[0])
+    return result[0]
+
+
+def _safe_int(value, default=None):
+    """
+    Converts a scraped string of digits to int, returning default for anything else. Like the former
+    str.isdigit() checks, signs, surrounding whitespace and decimal points are not accepted.
+    """
+    if isinstance(value, str) and value.isdigit():
+        try:
+            return int(value)
+        except ValueError: # isdigit() also accepts digits such as '²' that int() rejects
+            return default
+    return default
+
+
+# Heat scores come from a handful of distinct strings ('0'-'3', "2'", 'W', 'U', 'T', ...), so nearly every call is a hit
+@functools.lru_cache(maxsize=256)
 def parse_score(score_raw):
     """Parses a raw score string into numeric points, bonus flag, and accident text."""
     points_numeric = 0
@@ -119,552 +311,610 @@ def parse_score(score_raw):
 
     return points_numeric, with_bonus, accident_text
 
-def transform_and_load(conn):
-    """Reads JSON files, transforms data, and loads into the database."""
-    logging.info("Starting data transformation and loading process.")
-    cursor = conn.cursor()
-    # Input directory for raw JSON files (mounted from ./output/ekstraliga_scraper)
-    input_dir = '/app/ekstraligapl/output'
-    # Output directory for processed JSON files (mounted from ./output/data_transformer)
-    processed_dir = '/app/output/data_transformer'
+def parse_file(filepath):
+    """
+    Reads and decodes one match JSON file in a single binary read.
+    Returns (match_data, error_message); match_data is None when the file could not be read.
+    """
+    logging.debug("Attempting to open file: %s", filepath)
+    try:
+        with open(filepath, 'rb') as f:
+            logging.debug("Successfully opened file: %s", filepath)
+            raw_data = f.read()
+        # Files are UTF-8 (written by MatchJsonWriterPipeline); orjson.JSONDecodeError subclasses json.JSONDecodeError
+        match_data = orjson.loads(raw_data) if orjson is not None else json.loads(raw_data.decode('utf-8'))
+        logging.debug("Successfully loaded JSON data from file: %s", filepath)
+        return match_data, None
+    except FileNotFoundError:
+        return None, f"File not found: {filepath}"
+    except json.JSONDecodeError:
+        return None, f"Error decoding JSON from file: {filepath}"
+    except Exception as e:
+        return None, f"An unexpected error occurred while reading file {filepath}: {e}"
 
-    if not os.path.exists(input_dir):
-        logging.error(f"Input directory not found: {input_dir}")
-        return
+def iter_parsed_files(filepaths, parse_executor):
+    """
+    Yields (filepath, match_data, error_message) for each file, in order. Up to PARSE_PREFETCH_DEPTH files are read
+    and decoded ahead on parse_executor while the caller loads the current one, so at most that many decoded files
+    wait in memory.
+    """
+    filepath_iter = iter(filepaths)
+    pending = collections.deque(
+        (filepath, parse_executor.submit(parse_file, filepath))
+        for filepath in itertools.islice(filepath_iter, PARSE_PREFETCH_DEPTH)
+    )
+    while pending:
+        filepath, future = pending.popleft()
+        for next_filepath in itertools.islice(filepath_iter, 1): # Refill the slot just taken
+            pending.append((next_filepath, parse_executor.submit(parse_file, next_filepath)))
+        yield (filepath, *future.result()) # parse_file reports its errors in the result, it does not raise
+
+
+# Keys of a detailed telemetry entry, in the order of the heat_participants telemetry columns
+# (lap_time_seconds, distance_meters, vmax_kmh, lap1_time_seconds ... lap4_time_seconds)
+TELEMETRY_VALUE_KEYS = ('lap_time', 'distance', 'vmax_lap', 'lap1_time', 'lap2_time', 'lap3_time', 'lap4_time')
+
+# Statements of load_match, composed once at import instead of once per file
+INSERT_MATCH_QUERY = sql.SQL("""
+    INSERT INTO matches (
+        match_url, source_system, competition_id, round_type, round_name,
+        match_datetime, attendance, referee_id, track_commissioner_id, arena_id,
+        home_team_id, away_team_id, home_score, away_score, telemetry_data_status
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (match_url) DO UPDATE SET
+        source_system = EXCLUDED.source_system,
+        competition_id = EXCLUDED.competition_id,
+        round_type = EXCLUDED.round_type,
+        round_name = EXCLUDED.round_name,
+        match_datetime = EXCLUDED.match_datetime,
+        attendance = EXCLUDED.attendance,
+        referee_id = EXCLUDED.referee_id,
+        track_commissioner_id = EXCLUDED.track_commissioner_id,
+        arena_id = EXCLUDED.arena_id,
+        home_team_id = EXCLUDED.home_team_id,
+        away_team_id = EXCLUDED.away_team_id,
+        home_score = EXCLUDED.home_score,
+        away_score = EXCLUDED.away_score,
+        telemetry_data_status = EXCLUDED.telemetry_data_status
+    RETURNING match_id
+""")
+
+INSERT_MATCH_TEAM_INFO_QUERY = sql.SQL("""
+    INSERT INTO match_team_info (match_id, team_id, match_specific_team_name, manager_name, coach_name, head_of_team_name)
+    VALUES %s
+    ON CONFLICT (match_id, team_id) DO UPDATE SET
+        match_specific_team_name = EXCLUDED.match_specific_team_name,
+        manager_name = EXCLUDED.manager_name,
+        coach_name = EXCLUDED.coach_name,
+        head_of_team_name = EXCLUDED.head_of_team_name
+""")
+
+INSERT_MATCH_RIDER_STATS_QUERY = sql.SQL("""
+    INSERT INTO match_rider_stats (match_id, team_id, rider_id, rider_number_in_match, total_sum_points, total_bonus_points, raw_scores_array)
+    VALUES %s
+    ON CONFLICT (match_id, team_id, rider_id) DO UPDATE SET
+        rider_number_in_match = EXCLUDED.rider_number_in_match,
+        total_sum_points = EXCLUDED.total_sum_points,
+        total_bonus_points = EXCLUDED.total_bonus_points,
+        raw_scores_array = EXCLUDED.raw_scores_array
+    RETURNING match_rider_stat_id, match_id, rider_id
+""")
+
+INSERT_HEATS_QUERY = sql.SQL("""
+    INSERT INTO heats (match_id, heat_display_number, heat_sequence_in_match, hometeam_heat_score, awayteam_heat_score, hometeam_current_match_score_after_heat, awayteam_current_match_score_after_heat)
+    VALUES %s
+    ON CONFLICT (match_id, heat_sequence_in_match) DO UPDATE SET
+        heat_display_number = EXCLUDED.heat_display_number,
+        hometeam_heat_score = EXCLUDED.hometeam_heat_score,
+        awayteam_heat_score = EXCLUDED.awayteam_heat_score,
+        hometeam_current_match_score_after_heat = EXCLUDED.hometeam_current_match_score_after_heat,
+        awayteam_current_match_score_after_heat = EXCLUDED.awayteam_current_match_score_after_heat
+    RETURNING heat_id, heat_sequence_in_match
+""")
+
+# Columns of heat_participants written by load_match, in the order of its per-column lists
+HEAT_PARTICIPANT_COLUMNS = (
+    'heat_id', 'match_rider_stat_id', 'rider_name', 'substituted_rider_name',
+    'starting_gate', 'helmet_color', 'score_raw', 'score', 'with_bonus', 'accident', 'with_warning',
+    'lap_time_seconds', 'distance_meters', 'vmax_kmh', 'lap1_time_seconds', 'lap2_time_seconds', 'lap3_time_seconds', 'lap4_time_seconds',
+)
+
+# Takes one array per column: the server unnests them into a single row source instead of parsing a VALUES row per participant.
+# {arrays} is filled by type_heat_participants_query with each array cast to its column's type from the catalog.
+INSERT_HEAT_PARTICIPANTS_TEMPLATE = sql.SQL("""
+    INSERT INTO heat_participants ({columns})
+    SELECT * FROM unnest({arrays})
+    ON CONFLICT (heat_id, match_rider_stat_id) DO UPDATE SET
+        rider_name = EXCLUDED.rider_name,
+        substituted_rider_name = EXCLUDED.substituted_rider_name,
+        starting_gate = EXCLUDED.starting_gate,
+        helmet_color = EXCLUDED.helmet_color,
+        score_raw = EXCLUDED.score_raw,
+        score = EXCLUDED.score,
+        with_bonus = EXCLUDED.with_bonus,
+        accident = EXCLUDED.accident,
+        with_warning = EXCLUDED.with_warning,
+        lap_time_seconds = EXCLUDED.lap_time_seconds,
+        distance_meters = EXCLUDED.distance_meters,
+        vmax_kmh = EXCLUDED.vmax_kmh,
+        lap1_time_seconds = EXCLUDED.lap1_time_seconds,
+        lap2_time_seconds = EXCLUDED.lap2_time_seconds,
+        lap3_time_seconds = EXCLUDED.lap3_time_seconds,
+        lap4_time_seconds = EXCLUDED.lap4_time_seconds
+""")
+
+SELECT_COLUMN_TYPES_QUERY = sql.SQL("""
+    SELECT attname, format_type(atttypid, NULL)
+    FROM pg_attribute
+    WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+""")
+
+# Statements whose parameter casts come from the catalog, keyed by name; filled by type_heat_participants_query
+_TYPED_QUERIES = {}
+
+def type_heat_participants_query(conn):
+    """
+    Composes INSERT_HEAT_PARTICIPANTS_TEMPLATE with every unnest() array cast to the base type of its column.
+    Arrays need an element type (an all-NULL one has none), and reading it from heat_participants keeps the casts
+    valid for whatever types the schema uses. The typmod is left out: an explicit cast to varchar(n) or numeric(p,s)
+    would truncate or round, while the INSERT's assignment cast raises on over-length values like the VALUES rows did.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(SELECT_COLUMN_TYPES_QUERY, ('heat_participants',))
+        column_types = dict(cursor.fetchall())
+    conn.commit() # End the read transaction, so transform_and_load can switch autocommit off for the file batches
+    _TYPED_QUERIES['insert_heat_participants'] = INSERT_HEAT_PARTICIPANTS_TEMPLATE.format(
+        columns=sql.SQL(', ').join(map(sql.Identifier, HEAT_PARTICIPANT_COLUMNS)),
+        arrays=sql.SQL(', ').join(
+            sql.SQL("%s::{}[]").format(sql.SQL(column_types[column])) for column in HEAT_PARTICIPANT_COLUMNS
+        ),
+    )
 
-    # Create the processed directory if it doesn't exist
-    if not os.path.exists(processed_dir):
-        try:
-            os.makedirs(processed_dir)
-            logging.info(f"Created processed directory: {processed_dir}")
-        except OSError as e:
-            logging.error(f"Error creating processed directory {processed_dir}: {e}")
-            return # Cannot proceed if processed directory cannot be created
+# Server-side prepared forms of hot statements (EXECUTE queries), keyed by statement name; filled by prepare_statements
+_PREPARED_QUERIES = {}
 
+def _positional_params(query_string):
+    """Rewrites the %s placeholders of query_string as PREPARE's positional $1, $2, ... parameters."""
+    counter = itertools.count(1)
+    return re.sub(r'%s', lambda _: f"${next(counter)}", query_string)
 
-    json_files = [f for f in os.listdir(input_dir) if f.endswith('.json')]
-    logging.info(f"Found {len(json_files)} JSON files in {input_dir}")
+def _prepare(cursor, name, query):
+    """PREPAREs query under name and returns the EXECUTE query taking the same parameters."""
+    query_string = query.as_string(cursor)
+    cursor.execute(sql.SQL("PREPARE {} AS {}").format(sql.Identifier(name), sql.SQL(_positional_params(query_string))))
+    placeholders = sql.SQL(', ').join(sql.Placeholder() * query_string.count('%s'))
+    return sql.SQL("EXECUTE {} ({})").format(sql.Identifier(name), placeholders)
 
-    for filename in json_files:
-        filepath = os.path.join(input_dir, filename) # Corrected path
-        logging.info(f"Processing file: {filename}")
-        logging.info(f"Attempting to open file: {filepath}")
+def prepare_statements(conn):
+    """
+    PREPAREs the lookup SELECT/INSERT pairs of get_or_create_id and the match upsert on the connection, so the server
+    parses and plans them once per run instead of on every execute. Prepared statements live as long as the connection.
+    """
+    with conn.cursor() as cursor:
+        for table_name, column_name, returning_id_column in LOOKUP_TABLES:
+            query_select, query_insert = _lookup_queries(table_name, column_name, returning_id_column)
+            _LOOKUP_QUERIES[(table_name, column_name, returning_id_column)] = (
+                _prepare(cursor, f"select_{table_name}", query_select),
+                _prepare(cursor, f"insert_{table_name}", query_insert),
+            )
+        _PREPARED_QUERIES['upsert_match'] = _prepare(cursor, 'upsert_match', INSERT_MATCH_QUERY)
+    conn.commit() # End the transaction, so transform_and_load can switch autocommit off for the file batches
+    logging.info("Prepared %s statements.", len(LOOKUP_TABLES) * 2 + len(_PREPARED_QUERIES))
+
+def load_match(cursor, filename, match_data):
+    """
+    Transforms one decoded match file and loads it into the database, in the transaction of the current batch.
+    Returns True on success; on failure only this file's changes are rolled back (to its savepoint) and False is returned.
+    Runs in the main process, the only one holding the connection.
+    """
+    lookup_cache_size = len(_LOOKUP_CACHE)
+    cursor.execute("SAVEPOINT load_match")
+    try:
+        # --- Process Lookup Tables First ---
 
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                logging.info(f"Successfully opened file: {filepath}")
-                match_data = json.load(f)
-                logging.info(f"Successfully loaded JSON data from file: {filepath}")
-
-            # Start a transaction for this file
-            conn.autocommit = False
-
-            # --- Process Lookup Tables First ---
-
-            # Arena
-            arena_name = match_data.get('arena')
-            arena_id = get_or_create_id(cursor, 'arenas', 'name', arena_name, 'arena_id')
-
-            # Competitions
-            competition_name = match_data.get('competition')
-            competition_id = get_or_create_id(cursor, 'competitions', 'name', competition_name, 'competition_id')
-
-            # Referees
-            referee_name = match_data.get('referee')
-            referee_id = get_or_create_id(cursor, 'referees', 'name', referee_name, 'referee_id')
-
-            # Track Commissioners
-            commissioner_name = match_data.get('track_commissioner')
-            commissioner_id = get_or_create_id(cursor, 'track_commissioners', 'name', commissioner_name, 'commissioner_id')
-
-            # Teams
-            home_team_full_name = match_data.get('team1', {}).get('team_name')
-            home_team_code = match_data.get('home_team_details') # Use abbreviation as team_code
-            away_team_full_name = match_data.get('team2', {}).get('team_name')
-            away_team_code = match_data.get('away_team_details') # Use abbreviation as team_code
-
-            # Process Home Team
-            home_team_id = None
-            if home_team_code:
-                # Try to find by team_code first
-                query_select_code = sql.SQL("SELECT team_id FROM teams WHERE team_code = %s").format()
-                cursor.execute(query_select_code, (home_team_code,))
-                result = cursor.fetchone()
-                if result:
-                    home_team_id = result[0]
-                    # Update existing team with full_name and arena_id if null
-                    update_query = sql.SQL("""
-                        UPDATE teams
-                        SET full_name = COALESCE(full_name, %s),
-                            arena_id = COALESCE(arena_id, %s)
-                        WHERE team_id = %s
-                    """)
-                    cursor.execute(update_query, (home_team_full_name, arena_id, home_team_id))
-                    logging.info(f"Found home team by code '{home_team_code}', updated ID: {home_team_id}")
-
-            if home_team_id is None and home_team_full_name:
-                # If not found by code, try to find by full_name
-                query_select_name = sql.SQL("SELECT team_id FROM teams WHERE full_name = %s").format()
-                cursor.execute(query_select_name, (home_team_full_name,))
-                result = cursor.fetchone()
-                if result:
-                    home_team_id = result[0]
-                    # Update existing team with team_code and arena_id if null
-                    update_query = sql.SQL("""
-                        UPDATE teams
-                        SET team_code = COALESCE(team_code, %s),
-                            arena_id = COALESCE(arena_id, %s)
-                        WHERE team_id = %s
-                    """)
-                    cursor.execute(update_query, (home_team_code, arena_id, home_team_id))
-                    logging.info(f"Found home team by name '{home_team_full_name}', updated ID: {home_team_id}")
-
-            if home_team_id is None:
-                # If not found by either, insert new team
-                if home_team_code or home_team_full_name: # Only insert if we have at least one identifier
-                    insert_query = sql.SQL("""
-                        INSERT INTO teams (team_code, full_name, arena_id)
-                        VALUES (%s, %s, %s)
-                        ON CONFLICT (team_code) DO NOTHING -- Safeguard
-                        RETURNING team_id
-                    """)
-                    cursor.execute(insert_query, (home_team_code, home_team_full_name, arena_id))
-                    inserted_id = cursor.fetchone()
-                    if inserted_id:
-                        home_team_id = inserted_id[0]
-                        logging.info(f"Inserted new home team, ID: {home_team_id}")
-                    else:
-                         # Conflict occurred, retrieve the existing ID by code
-                         if home_team_code:
-                             query_select_code = sql.SQL("SELECT team_id FROM teams WHERE team_code = %s").format()
-                             cursor.execute(query_select_code, (home_team_code,))
-                             result = cursor.fetchone()
-                             if result:
-                                 home_team_id = result[0]
-                                 logging.info(f"Conflict on home team insert, retrieved existing ID by code: {home_team_id}")
-                             else:
-                                 logging.error(f"Failed to get or create home team with code '{home_team_code}' and name '{home_team_full_name}' after conflict.")
-                         else:
-                             logging.error(f"Failed to get or create home team with name '{home_team_full_name}' (no code provided).")
-                else:
-                    logging.warning(f"Cannot process home team: neither code nor name provided in file {filename}.")
-
-
-            # Process Away Team
-            away_team_id = None
-            if away_team_code:
-                # Try to find by team_code first
-                query_select_code = sql.SQL("SELECT team_id FROM teams WHERE team_code = %s").format()
-                cursor.execute(query_select_code, (away_team_code,))
-                result = cursor.fetchone()
-                if result:
-                    away_team_id = result[0]
-                    # Update existing team with full_name if null
-                    update_query = sql.SQL("""
-                        UPDATE teams
-                        SET full_name = COALESCE(full_name, %s)
-                        WHERE team_id = %s
-                    """)
-                    cursor.execute(update_query, (away_team_full_name, away_team_id))
-                    logging.info(f"Found away team by code '{away_team_code}', updated ID: {away_team_id}")
-
-            if away_team_id is None and away_team_full_name:
-                # If not found by code, try to find by full_name
-                query_select_name = sql.SQL("SELECT team_id FROM teams WHERE full_name = %s").format()
-                cursor.execute(query_select_name, (away_team_full_name,))
-                result = cursor.fetchone()
-                if result:
-                    away_team_id = result[0]
-                    # Update existing team with team_code if null
-                    update_query = sql.SQL("""
-                        UPDATE teams
-                        SET team_code = COALESCE(team_code, %s)
-                        WHERE team_id = %s
-                    """)
-                    cursor.execute(update_query, (away_team_code, away_team_id))
-                    logging.info(f"Found away team by name '{away_team_full_name}', updated ID: {away_team_id}")
-
-            if away_team_id is None:
-                 # If not found by either, insert new team
-                 if away_team_code or away_team_full_name: # Only insert if we have at least one identifier
-                     insert_query = sql.SQL("""
-                         INSERT INTO teams (team_code, full_name)
-                         VALUES (%s, %s)
-                         ON CONFLICT (team_code) DO NOTHING -- Safeguard
-                         RETURNING team_id
-                     """)
-                     cursor.execute(insert_query, (away_team_code, away_team_full_name))
-                     inserted_id = cursor.fetchone()
-                     if inserted_id:
-                         away_team_id = inserted_id[0]
-                         logging.info(f"Inserted new away team, ID: {away_team_id}")
-                     else:
-                          # Conflict occurred, retrieve the existing ID by code
-                          if away_team_code:
-                              query_select_code = sql.SQL("SELECT team_id FROM teams WHERE team_code = %s").format()
-                              cursor.execute(query_select_code, (away_team_code,))
-                              result = cursor.fetchone()
-                              if result:
-                                  away_team_id = result[0]
-                                  logging.info(f"Conflict on away team insert, retrieved existing ID by code: {away_team_id}")
-                              else:
-                                  logging.error(f"Failed to get or create away team with code '{away_team_code}' and name '{away_team_full_name}' after conflict.")
-                          else:
-                              logging.error(f"Failed to get or create away team with name '{away_team_full_name}' (no code provided).")
-                 else:
-                     logging.warning(f"Cannot process away team: neither code nor name provided in file {filename}.")
+        # Arena
+        arena_name = match_data.get('arena')
+        arena_id = get_or_create_id(cursor, 'arenas', 'name', arena_name, 'arena_id')
 
+        # Competitions
+        competition_name = match_data.get('competition')
+        competition_id = get_or_create_id(cursor, 'competitions', 'name', competition_name, 'competition_id')
 
-            # Riders (collect all unique riders from both teams)
-            all_riders_in_match = []
-            if match_data.get('team1', {}).get('riders'):
-                all_riders_in_match.extend(match_data['team1']['riders'])
-            if match_data.get('team2', {}).get('riders'):
-                all_riders_in_match.extend(match_data['team2']['riders'])
+        # Referees
+        referee_name = match_data.get('referee')
+        referee_id = get_or_create_id(cursor, 'referees', 'name', referee_name, 'referee_id')
 
-            rider_name_to_id = {}
-            for rider_data in all_riders_in_match:
-                rider_name = rider_data.get('name')
-                if rider_name and rider_name.strip():
-                    rider_id = get_or_create_id(cursor, 'riders', 'name', rider_name, 'rider_id')
-                    if rider_id:
-                        rider_name_to_id[rider_name] = rider_id
-
-            # --- Process Match Details ---
-
-            # Match
-            match_datetime_str = match_data.get('match_date')
-            match_datetime = None
-            if match_datetime_str:
-                try:
-                    # Assuming format "DD.MM.YYYY HH:MM"
-                    match_datetime = datetime.strptime(match_datetime_str, '%d.%m.%Y %H:%M')
-                except ValueError:
-                    logging.warning(f"Could not parse match_date: {match_datetime_str} in file {filename}")
-
-            attendance = None
-            attendance_summary = match_data.get('attendance_summary')
-            if attendance_summary and attendance_summary.isdigit():
-                 attendance = int(attendance_summary)
-
-            insert_match_query = sql.SQL("""
-                INSERT INTO matches (
-                    match_url, source_system, competition_id, round_type, round_name,
-                    match_datetime, attendance, referee_id, track_commissioner_id, arena_id,
-                    home_team_id, away_team_id, home_score, away_score, telemetry_data_status
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (match_url) DO UPDATE SET
-                    source_system = EXCLUDED.source_system,
-                    competition_id = EXCLUDED.competition_id,
-                    round_type = EXCLUDED.round_type,
-                    round_name = EXCLUDED.round_name,
-                    match_datetime = EXCLUDED.match_datetime,
-                    attendance = EXCLUDED.attendance,
-                    referee_id = EXCLUDED.referee_id,
-                    track_commissioner_id = EXCLUDED.track_commissioner_id,
-                    arena_id = EXCLUDED.arena_id,
-                    home_team_id = EXCLUDED.home_team_id,
-                    away_team_id = EXCLUDED.away_team_id,
-                    home_score = EXCLUDED.home_score,
-                    away_score = EXCLUDED.away_score,
-                    telemetry_data_status = EXCLUDED.telemetry_data_status
-                RETURNING match_id
-            """)
-            cursor.execute(insert_match_query, (
-                match_data.get('match_url'),
-                match_data.get('source'),
-                competition_id,
-                match_data.get('round_type'),
-                match_data.get('round'),
-                match_datetime,
-                attendance,
-                referee_id,
-                commissioner_id,
-                arena_id,
+        # Track Commissioners
+        commissioner_name = match_data.get('track_commissioner')
+        commissioner_id = get_or_create_id(cursor, 'track_commissioners', 'name', commissioner_name, 'commissioner_id')
+
+        # Teams
+        home_team_full_name = match_data.get('team1', {}).get('team_name')
+        home_team_code = match_data.get('home_team_details') # Use abbreviation as team_code
+        away_team_full_name = match_data.get('team2', {}).get('team_name')
+        away_team_code = match_data.get('away_team_details') # Use abbreviation as team_code
+
+        # Home team also records the match arena as its home track; the away team leaves arena_id untouched
+        home_team_id = upsert_team(cursor, home_team_code, home_team_full_name, arena_id, 'home', filename)
+        away_team_id = upsert_team(cursor, away_team_code, away_team_full_name, None, 'away', filename)
+
+
+        # Riders (collect all unique riders from both teams)
+        all_riders_in_match = []
+        if match_data.get('team1', {}).get('riders'):
+            all_riders_in_match.extend(match_data['team1']['riders'])
+        if match_data.get('team2', {}).get('riders'):
+            all_riders_in_match.extend(match_data['team2']['riders'])
+
+        rider_name_to_id = get_or_create_ids(
+            cursor, 'riders', 'name', [rider_data.get('name') for rider_data in all_riders_in_match], 'rider_id'
+        )
+
+        # --- Process Match Details ---
+
+        # Match
+        match_datetime_str = match_data.get('match_date')
+        match_datetime = None
+        if match_datetime_str:
+            try:
+                # Assuming format "DD.MM.YYYY HH:MM"
+                match_datetime = datetime.strptime(match_datetime_str, '%d.%m.%Y %H:%M')
+            except ValueError:
+                logging.warning("Could not parse match_date: %s in file %s", match_datetime_str, filename)
+
+        attendance = _safe_int(match_data.get('attendance_summary'))
+
+        telemetry_data = match_data.get('telemetry_data')
+        cursor.execute(_PREPARED_QUERIES.get('upsert_match', INSERT_MATCH_QUERY), (
+            match_data.get('match_url'),
+            match_data.get('source'),
+            competition_id,
+            match_data.get('round_type'),
+            match_data.get('round'),
+            match_datetime,
+            attendance,
+            referee_id,
+            commissioner_id,
+            arena_id,
+            home_team_id,
+            away_team_id,
+            _safe_int(match_data.get('home_score_details'), 0),
+            _safe_int(match_data.get('away_score_details'), 0),
+            Json(telemetry_data, dumps=_json_dumps) if isinstance(telemetry_data, (dict, list)) else telemetry_data # Adapt dict or list as a JSON literal
+        ))
+        match_id = cursor.fetchone()[0]
+
+        # --- Process Match-Specific Details ---
+
+        # Match Team Info
+        match_team_info_data = []
+        if match_data.get('team1'):
+            team1_data = match_data['team1']
+            match_team_info_data.append((
+                match_id,
                 home_team_id,
+                team1_data.get('team_name'),
+                team1_data.get('manager'),
+                team1_data.get('coach'),
+                team1_data.get('head_of_team')
+            ))
+        if match_data.get('team2'):
+            team2_data = match_data['team2']
+            match_team_info_data.append((
+                match_id,
                 away_team_id,
-                int(match_data.get('home_score_details', 0)) if match_data.get('home_score_details', '').isdigit() else 0,
-                int(match_data.get('away_score_details', 0)) if match_data.get('away_score_details', '').isdigit() else 0,
-                json.dumps(match_data.get('telemetry_data')) if isinstance(match_data.get('telemetry_data'), (dict, list)) else match_data.get('telemetry_data') # Convert dict or list to JSON string
+                team2_data.get('team_name'),
+                team2_data.get('manager'),
+                team2_data.get('coach'),
+                team2_data.get('head_of_team')
             ))
-            match_id = cursor.fetchone()[0]
 
-            # --- Process Match-Specific Details ---
+        if match_team_info_data:
+            execute_values(cursor, INSERT_MATCH_TEAM_INFO_QUERY, match_team_info_data, page_size=EXECUTE_VALUES_PAGE_SIZE)
 
-            # Match Team Info
-            match_team_info_data = []
-            if match_data.get('team1'):
-                team1_data = match_data['team1']
-                match_team_info_data.append((
-                    match_id,
-                    home_team_id,
-                    team1_data.get('team_name'),
-                    team1_data.get('manager'),
-                    team1_data.get('coach'),
-                    team1_data.get('head_of_team')
-                ))
-            if match_data.get('team2'):
-                team2_data = match_data['team2']
-                match_team_info_data.append((
+        # Match Rider Stats
+        match_rider_stats_data = []
+        rider_match_stat_id_map = {} # Map (match_id, rider_id) to match_rider_stat_id
+
+        def process_team_rider_stats(team_data, team_id):
+            if team_data and team_data.get('riders'):
+                for rider_data in team_data['riders']:
+                    logging.debug("Processing rider data for match_rider_stats: %s", rider_data)
+                    rider_name = rider_data.get('name')
+                    rider_id = rider_name_to_id.get(rider_name)
+
+                    if rider_id:
+                        rider_number = rider_data.get('number')
+                        scores_raw = rider_data.get('scores') # Get scores, don't default to [] yet
+                        logging.debug("Rider %s (%s): scores_raw type: %s, content: %s", rider_name, rider_id, type(scores_raw), scores_raw)
+
+                        # Explicitly check for dict and handle other unexpected types
+                        if isinstance(scores_raw, dict):
+                            logging.error("Expected list or None for scores_raw for rider %s (%s) in file %s, but got dict. Skipping scores for this rider.", rider_name, rider_id, filename)
+                            scores_raw = [] # Default to empty list if it's a dict
+                        elif not isinstance(scores_raw, list):
+                            logging.warning("Expected list or None for scores_raw for rider %s (%s) in file %s, but got %s. Using empty list.", rider_name, rider_id, filename, type(scores_raw))
+                            scores_raw = [] # Default to empty list for other unexpected types
+                        # If scores_raw is None or already a list, it proceeds as is
+
+                        total_sum = _safe_int(rider_data.get('sum')) # Use None for empty/non-digit
+                        bonus_sum = _safe_int(rider_data.get('bonus')) # Use None for empty/non-digit
+
+                        match_rider_stats_data.append((
+                            match_id, team_id, rider_id, rider_number,
+                            total_sum, bonus_sum, scores_raw
+                        ))
+
+        process_team_rider_stats(match_data.get('team1'), home_team_id)
+        process_team_rider_stats(match_data.get('team2'), away_team_id)
+
+        if match_rider_stats_data:
+            logging.debug("Preparing to insert into match_rider_stats. Data sample: %s", match_rider_stats_data[:5]) # Log sample data
+            # Use execute_values with returning to get the generated IDs
+            results = execute_values(cursor, INSERT_MATCH_RIDER_STATS_QUERY, match_rider_stats_data, page_size=EXECUTE_VALUES_PAGE_SIZE, fetch=True)
+            for stat_id, mid, rid in results:
+                rider_match_stat_id_map[(mid, rid)] = stat_id
+
+
+        # Heats and Heat Participants
+        if match_data.get('match_details'):
+            # Collect all heats of the match first, so they are upserted with a single execute_values call
+            heats_rows = []
+            heats_to_process = [] # (heat_sequence_in_match, heat_data, heat_display_number)
+            heat_sequence_counter = 0
+            for heat_data in match_data['match_details']:
+                logging.debug("Processing heat data: %s", heat_data)
+                heat_sequence_counter += 1 # Increment sequence for each heat object
+
+                heat_display_number = heat_data.get('heat_number')
+                if not heat_display_number:
+                    logging.warning("Missing heat_number in heat data for file %s. Skipping heat.", filename)
+                    continue
+
+                heats_rows.append((
                     match_id,
-                    away_team_id,
-                    team2_data.get('team_name'),
-                    team2_data.get('manager'),
-                    team2_data.get('coach'),
-                    team2_data.get('head_of_team')
+                    heat_display_number,
+                    heat_sequence_counter,
+                    _safe_int(heat_data.get('hometeam_heat_score')), # Use None for empty/non-digit
+                    _safe_int(heat_data.get('awayteam_heat_score')), # Use None for empty/non-digit
+                    _safe_int(heat_data.get('hometeam_current_match_score')), # Use None for empty/non-digit
+                    _safe_int(heat_data.get('awayteam_current_match_score')), # Use None for empty/non-digit
                 ))
+                heats_to_process.append((heat_sequence_counter, heat_data, heat_display_number))
 
-            if match_team_info_data:
-                insert_match_team_info_query = sql.SQL("""
-                    INSERT INTO match_team_info (match_id, team_id, match_specific_team_name, manager_name, coach_name, head_of_team_name)
-                    VALUES %s
-                    ON CONFLICT (match_id, team_id) DO UPDATE SET
-                        match_specific_team_name = EXCLUDED.match_specific_team_name,
-                        manager_name = EXCLUDED.manager_name,
-                        coach_name = EXCLUDED.coach_name,
-                        head_of_team_name = EXCLUDED.head_of_team_name
-                """)
-                execute_values(cursor, insert_match_team_info_query, match_team_info_data)
-
-            # Match Rider Stats
-            match_rider_stats_data = []
-            rider_match_stat_id_map = {} # Map (match_id, rider_id) to match_rider_stat_id
-
-            def process_team_rider_stats(team_data, team_id):
-                if team_data and team_data.get('riders'):
-                    for rider_data in team_data['riders']:
-                        logging.info(f"Processing rider data for match_rider_stats: {rider_data}")
-                        rider_name = rider_data.get('name')
+            heat_id_by_sequence = {} # Map heat_sequence_in_match to heat_id
+            if heats_rows:
+                # Use execute_values with returning to get the generated IDs
+                results = execute_values(cursor, INSERT_HEATS_QUERY, heats_rows, page_size=EXECUTE_VALUES_PAGE_SIZE, fetch=True)
+                for heat_id, heat_sequence in results:
+                    heat_id_by_sequence[heat_sequence] = heat_id
+
+            # Get all telemetry data for the match, if available
+            # Assuming telemetry_data in the JSON is a list of rider summaries,
+            # or {"error": ..., "data": [...]} when the spider could not read the telemetry tab
+            all_rider_telemetry_list = match_data.get('telemetry_data', [])
+            if isinstance(all_rider_telemetry_list, dict):
+                 logging.warning("No telemetry for file %s: %s", filename, all_rider_telemetry_list.get('error'))
+                 all_rider_telemetry_list = all_rider_telemetry_list.get('data') or []
+            if not isinstance(all_rider_telemetry_list, list):
+                 logging.warning("Expected list for telemetry_data in file %s, but got %s. Skipping telemetry for this file.", filename, type(all_rider_telemetry_list))
+                 all_rider_telemetry_list = [] # Ensure it's a list
+
+            logging.debug("All rider telemetry data list for match: %s", all_rider_telemetry_list)
+
+            # Index the detailed telemetry once per match as {RIDER NAME: {heat number: detail}}, so each participant
+            # costs two dict lookups. Names are upper-cased (case-insensitive for robustness) and heat numbers lose
+            # their dots (handle potential trailing dot in heat_number). The first summary per name and the first
+            # detail per heat win, like the former linear scans.
+            telemetry_by_rider = {}
+            for rider_tele_summary in all_rider_telemetry_list:
+                if not isinstance(rider_tele_summary, dict):
+                    continue
+                rider_key = (rider_tele_summary.get('rider_name') or '').upper()
+                if rider_key in telemetry_by_rider:
+                    continue
+                heat_details = telemetry_by_rider[rider_key] = {}
+                detailed_telemetry = rider_tele_summary.get('detailed_telemetry')
+                if isinstance(detailed_telemetry, list):
+                    for heat_tele_detail in detailed_telemetry:
+                        heat_details.setdefault(heat_tele_detail.get('heat_number', '').replace('.', ''), heat_tele_detail)
+                elif rider_tele_summary:
+                    logging.warning("Expected list for detailed_telemetry for rider %s in file %s, but got %s. Skipping detailed telemetry for this rider.", rider_tele_summary.get('rider_name'), filename, type(detailed_telemetry))
+
+            # Heat participants of all heats go into one batch as well, kept as one list per heat_participants column
+            # (extended in lockstep) so they feed the unnest() arrays of the insert without a transpose
+            heat_ids, stat_ids, rider_names, substituted_rider_names, starting_gates, helmet_colors = [], [], [], [], [], []
+            raw_scores, scores, bonus_flags, accidents, warning_flags = [], [], [], [], []
+            telemetry_columns = [[] for _ in TELEMETRY_VALUE_KEYS]
+            for heat_sequence, heat_data, heat_display_number in heats_to_process:
+                heat_id = heat_id_by_sequence[heat_sequence]
+                heat_key = heat_display_number.replace('.', '') # Key of this heat in telemetry_by_rider
+
+                # Heat Participants
+                if heat_data.get('riders'):
+                    for participant_data in heat_data['riders']:
+                        logging.debug("Processing heat participant data: %s", participant_data)
+                        participant_get = participant_data.get # Bound once, read for most fields below
+                        rider_name = participant_get('rider')
                         rider_id = rider_name_to_id.get(rider_name)
 
                         if rider_id:
-                            rider_number = rider_data.get('number')
-                            scores_raw = rider_data.get('scores') # Get scores, don't default to [] yet
-                            logging.info(f"Rider {rider_name} ({rider_id}): scores_raw type: {type(scores_raw)}, content: {scores_raw}")
-
-                            # Explicitly check for dict and handle other unexpected types
-                            if isinstance(scores_raw, dict):
-                                logging.error(f"Expected list or None for scores_raw for rider {rider_name} ({rider_id}) in file {filename}, but got dict. Skipping scores for this rider.")
-                                scores_raw = [] # Default to empty list if it's a dict
-                            elif not isinstance(scores_raw, list):
-                                logging.warning(f"Expected list or None for scores_raw for rider {rider_name} ({rider_id}) in file {filename}, but got {type(scores_raw)}. Using empty list.")
-                                scores_raw = [] # Default to empty list for other unexpected types
-                            # If scores_raw is None or already a list, it proceeds as is
-
-                            total_sum = int(rider_data.get('sum', 0)) if rider_data.get('sum', '').isdigit() else None # Use None for empty/non-digit
-                            bonus_sum = int(rider_data.get('bonus', 0)) if rider_data.get('bonus', '').isdigit() else None # Use None for empty/non-digit
-
-                            match_rider_stats_data.append((
-                                match_id, team_id, rider_id, rider_number,
-                                total_sum, bonus_sum, scores_raw
-                            ))
-
-            process_team_rider_stats(match_data.get('team1'), home_team_id)
-            process_team_rider_stats(match_data.get('team2'), away_team_id)
-
-            if match_rider_stats_data:
-                logging.info(f"Preparing to insert into match_rider_stats. Data sample: {match_rider_stats_data[:5]}") # Log sample data
-                insert_match_rider_stats_query = sql.SQL("""
-                    INSERT INTO match_rider_stats (match_id, team_id, rider_id, rider_number_in_match, total_sum_points, total_bonus_points, raw_scores_array)
-                    VALUES %s
-                    ON CONFLICT (match_id, team_id, rider_id) DO UPDATE SET
-                        rider_number_in_match = EXCLUDED.rider_number_in_match,
-                        total_sum_points = EXCLUDED.total_sum_points,
-                        total_bonus_points = EXCLUDED.total_bonus_points,
-                        raw_scores_array = EXCLUDED.raw_scores_array
-                    RETURNING match_rider_stat_id, match_id, rider_id
-                """)
-                # Use execute_values with returning to get the generated IDs
-                results = execute_values(cursor, insert_match_rider_stats_query, match_rider_stats_data, fetch=True)
-                for stat_id, mid, rid in results:
-                    rider_match_stat_id_map[(mid, rid)] = stat_id
-
-
-            # Heats and Heat Participants
-            if match_data.get('match_details'):
-                heat_sequence_counter = 0
-                for heat_data in match_data['match_details']:
-                    logging.info(f"Processing heat data: {heat_data}")
-                    heat_sequence_counter += 1 # Increment sequence for each heat object
-
-                    heat_display_number = heat_data.get('heat_number')
-                    if not heat_display_number:
-                        logging.warning(f"Missing heat_number in heat data for file {filename}. Skipping heat.")
-                        continue
-
-                    # Insert Heat
-                    insert_heat_query = sql.SQL("""
-                        INSERT INTO heats (match_id, heat_display_number, heat_sequence_in_match, hometeam_heat_score, awayteam_heat_score, hometeam_current_match_score_after_heat, awayteam_current_match_score_after_heat)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (match_id, heat_sequence_in_match) DO UPDATE SET
-                            heat_display_number = EXCLUDED.heat_display_number,
-                            hometeam_heat_score = EXCLUDED.hometeam_heat_score,
-                            awayteam_heat_score = EXCLUDED.awayteam_heat_score,
-                            hometeam_current_match_score_after_heat = EXCLUDED.hometeam_current_match_score_after_heat,
-                            awayteam_current_match_score_after_heat = EXCLUDED.awayteam_current_match_score_after_heat
-                        RETURNING heat_id
-                    """)
-                    cursor.execute(insert_heat_query, (
-                        match_id,
-                        heat_display_number,
-                        heat_sequence_counter,
-                        int(heat_data.get('hometeam_heat_score', 0)) if heat_data.get('hometeam_heat_score', '').isdigit() else None, # Use None for empty/non-digit
-                        int(heat_data.get('awayteam_heat_score', 0)) if heat_data.get('awayteam_heat_score', '').isdigit() else None, # Use None for empty/non-digit
-                        int(heat_data.get('hometeam_current_match_score', 0)) if heat_data.get('hometeam_current_match_score', '').isdigit() else None, # Use None for empty/non-digit
-                        int(heat_data.get('awayteam_current_match_score', 0)) if heat_data.get('awayteam_current_match_score', '').isdigit() else None, # Use None for empty/non-digit
-                    ))
-                    heat_id = cursor.fetchone()[0]
-
-                    # Heat Participants
-                    heat_participants_data = []
-                    if heat_data.get('riders'):
-                        # Get all telemetry data for the match, if available
-                        # Assuming telemetry_data in the JSON is a list of rider summaries
-                        all_rider_telemetry_list = match_data.get('telemetry_data', [])
-                        if not isinstance(all_rider_telemetry_list, list):
-                             logging.warning(f"Expected list for telemetry_data in file {filename}, but got {type(all_rider_telemetry_list)}. Skipping telemetry for this file.")
-                             all_rider_telemetry_list = [] # Ensure it's a list
-
-                        logging.info(f"All rider telemetry data list for match: {all_rider_telemetry_list}")
-
-                        for participant_data in heat_data['riders']:
-                            logging.info(f"Processing heat participant data: {participant_data}")
-                            rider_name = participant_data.get('rider')
-                            rider_id = rider_name_to_id.get(rider_name)
-
-                            if rider_id:
-                                # Get the match_rider_stat_id for this rider in this match
-                                match_rider_stat_id = rider_match_stat_id_map.get((match_id, rider_id))
-
-                                if match_rider_stat_id is None:
-                                     logging.warning(f"Could not find match_rider_stat_id for rider_id {rider_id} ({rider_name}) in match_id {match_id}. Skipping heat participant.")
-                                     continue # Skip this participant if match_rider_stat_id cannot be determined
-
-                                score_raw = participant_data.get('rider_score', '')
-                                points_numeric, with_bonus, accident_text = parse_score(score_raw)
-                                received_warning = bool(participant_data.get('warning')) # True if warning is not None/empty
-
-                                # --- Extract and parse telemetry data ---
-                                participant_telemetry_details = None
-                                # Find the rider's overall telemetry summary
-                                rider_telemetry_summary = None
-                                # Match rider by name (case-insensitive for robustness)
-                                rider_name_upper = rider_name.upper() if rider_name else None
-                                for rider_tele_summary in all_rider_telemetry_list:
-                                    if rider_tele_summary.get('rider_name', '').upper() == rider_name_upper:
-                                        rider_telemetry_summary = rider_tele_summary
-                                        break
-
-                                if rider_telemetry_summary and isinstance(rider_telemetry_summary.get('detailed_telemetry'), list):
-                                    # Find the specific heat telemetry within the rider's detailed_telemetry list
-                                    for heat_tele_detail in rider_telemetry_summary['detailed_telemetry']:
-                                        # Match by heat number (handle potential trailing dot in heat_number)
-                                        if heat_tele_detail.get('heat_number', '').replace('.', '') == heat_display_number.replace('.', ''):
-                                            participant_telemetry_details = heat_tele_detail
-                                            break
-                                elif rider_telemetry_summary:
-                                     logging.warning(f"Expected list for detailed_telemetry for rider {rider_name} in file {filename}, but got {type(rider_telemetry_summary.get('detailed_telemetry'))}. Skipping detailed telemetry for this rider.")
-
-
-                                lap_time_seconds = None
-                                distance_meters = None
-                                vmax_kmh = None
-                                lap1_time_seconds = None
-                                lap2_time_seconds = None
-                                lap3_time_seconds = None
-                                lap4_time_seconds = None
-
-                                if participant_telemetry_details:
-                                    lap_time_seconds = parse_telemetry_value(participant_telemetry_details.get('lap_time'))
-                                    distance_meters = parse_telemetry_value(participant_telemetry_details.get('distance'))
-                                    vmax_kmh = parse_telemetry_value(participant_telemetry_details.get('vmax_lap'))
-                                    lap1_time_seconds = parse_telemetry_value(participant_telemetry_details.get('lap1_time'))
-                                    lap2_time_seconds = parse_telemetry_value(participant_telemetry_details.get('lap2_time'))
-                                    lap3_time_seconds = parse_telemetry_value(participant_telemetry_details.get('lap3_time'))
-                                    lap4_time_seconds = parse_telemetry_value(participant_telemetry_details.get('lap4_time'))
-                                # --- End telemetry extraction ---
-
-
-                                heat_participants_data.append((
-                                    heat_id,
-                                    match_rider_stat_id,
-                                    rider_name, # Store rider_name as it appeared in heat data
-                                    participant_data.get('substituted_rider'),
-                                    # Check if starting_field is empty or None, use None if it is
-                                    participant_data.get('starting_field') if participant_data.get('starting_field') and participant_data.get('starting_field').strip() else None,
-                                    participant_data.get('helmet_color'),
-                                    score_raw,
-                                    points_numeric,
-                                    with_bonus,
-                                    accident_text,
-                                    received_warning,
-                                    # Add new telemetry values
-                                    lap_time_seconds,
-                                    distance_meters,
-                                    vmax_kmh,
-                                    lap1_time_seconds,
-                                    lap2_time_seconds,
-                                    lap3_time_seconds,
-                                    lap4_time_seconds
-                                ))
-
-                    if heat_participants_data:
-                        logging.info(f"Preparing to insert into heat_participants. Data sample: {heat_participants_data[:5]}") # Log sample data
-                        insert_heat_participants_query = sql.SQL("""
-                            INSERT INTO heat_participants (
-                                heat_id, match_rider_stat_id, rider_name, substituted_rider_name,
-                                starting_gate, helmet_color, score_raw, score, with_bonus, accident, with_warning,
-                                lap_time_seconds, distance_meters, vmax_kmh, lap1_time_seconds, lap2_time_seconds, lap3_time_seconds, lap4_time_seconds
-                            ) VALUES %s
-                            ON CONFLICT (heat_id, match_rider_stat_id) DO UPDATE SET
-                                rider_name = EXCLUDED.rider_name,
-                                substituted_rider_name = EXCLUDED.substituted_rider_name,
-                                starting_gate = EXCLUDED.starting_gate,
-                                helmet_color = EXCLUDED.helmet_color,
-                                score_raw = EXCLUDED.score_raw,
-                                score = EXCLUDED.score,
-                                with_bonus = EXCLUDED.with_bonus,
-                                accident = EXCLUDED.accident,
-                                with_warning = EXCLUDED.with_warning,
-                                lap_time_seconds = EXCLUDED.lap_time_seconds,
-                                distance_meters = EXCLUDED.distance_meters,
-                                vmax_kmh = EXCLUDED.vmax_kmh,
-                                lap1_time_seconds = EXCLUDED.lap1_time_seconds,
-                                lap2_time_seconds = EXCLUDED.lap2_time_seconds,
-                                lap3_time_seconds = EXCLUDED.lap3_time_seconds,
-                                lap4_time_seconds = EXCLUDED.lap4_time_seconds
-                        """)
-                        execute_values(cursor, insert_heat_participants_query, heat_participants_data)
-
-            # Commit the transaction for this file
-            conn.commit()
-            logging.info(f"Successfully processed and committed data for file: {filename}")
-
-            # Move the processed file to the processed directory
-            new_filepath = os.path.join(processed_dir, filename)
-            try:
-                shutil.move(filepath, new_filepath)
-                logging.info(f"Moved processed file to: {new_filepath}")
-            except shutil.Error as e:
-                logging.error(f"Error moving processed file {filepath} to {new_filepath}: {e}")
-            except OSError as e:
-                logging.error(f"Error moving processed file {filepath} to {new_filepath}: {e}")
-
-
-        except FileNotFoundError:
-            logging.error(f"File not found: {filepath}")
-            if conn:
-                conn.rollback() # Rollback transaction on error
-        except json.JSONDecodeError:
-            logging.error(f"Error decoding JSON from file: {filepath}")
-            if conn:
-                conn.rollback() # Rollback transaction on error
-        except Exception as e:
-            logging.error(f"An unexpected error occurred while processing file {filename}: {e}")
-            if conn:
-                conn.rollback() # Rollback transaction on error
-        finally:
-             conn.autocommit = True # Reset autocommit
+                            # Get the match_rider_stat_id for this rider in this match
+                            match_rider_stat_id = rider_match_stat_id_map.get((match_id, rider_id))
+
+                            if match_rider_stat_id is None:
+                                 logging.warning("Could not find match_rider_stat_id for rider_id %s (%s) in match_id %s. Skipping heat participant.", rider_id, rider_name, match_id)
+                                 continue # Skip this participant if match_rider_stat_id cannot be determined
+
+                            score_raw = participant_get('rider_score', '')
+                            points_numeric, with_bonus, accident_text = parse_score(score_raw)
+                            received_warning = bool(participant_get('warning')) # True if warning is not None/empty
+
+                            # --- Extract and parse telemetry data ---
+                            # Find the rider's telemetry for this heat (rider_name is non-empty, it resolved to rider_id)
+                            participant_telemetry_details = telemetry_by_rider.get(rider_name.upper(), {}).get(heat_key)
+
+                            telemetry_get = participant_telemetry_details.get if participant_telemetry_details else None
+                            # The spider pads missing cells with '', so a detail row can exist with no value at all;
+                            # skip the seven parse calls then (a numeric 0 is a value, so test for None/'' only)
+                            if telemetry_get is not None and any(telemetry_get(key) not in (None, '') for key in TELEMETRY_VALUE_KEYS):
+                                for telemetry_column, key in zip(telemetry_columns, TELEMETRY_VALUE_KEYS):
+                                    telemetry_column.append(parse_telemetry_value(telemetry_get(key)))
+                            else:
+                                for telemetry_column in telemetry_columns:
+                                    telemetry_column.append(None)
+                            # --- End telemetry extraction ---
+
+
+                            heat_ids.append(heat_id)
+                            stat_ids.append(match_rider_stat_id)
+                            rider_names.append(rider_name) # Store rider_name as it appeared in heat data
+                            substituted_rider_names.append(participant_get('substituted_rider'))
+                            # Check if starting_field is empty or None, use None if it is
+                            starting_field = participant_get('starting_field')
+                            starting_gates.append(starting_field if starting_field and starting_field.strip() else None)
+                            helmet_colors.append(participant_get('helmet_color'))
+                            raw_scores.append(score_raw)
+                            scores.append(points_numeric)
+                            bonus_flags.append(with_bonus)
+                            accidents.append(accident_text)
+                            warning_flags.append(received_warning)
+
+            if heat_ids:
+                logging.debug("Preparing to insert %s rows into heat_participants. Rider sample: %s", len(heat_ids), rider_names[:5]) # Log sample data
+                # One list per column, in HEAT_PARTICIPANT_COLUMNS order; psycopg2 adapts each list to an array
+                cursor.execute(_TYPED_QUERIES['insert_heat_participants'], [
+                    heat_ids, stat_ids, rider_names, substituted_rider_names, starting_gates, helmet_colors,
+                    raw_scores, scores, bonus_flags, accidents, warning_flags, *telemetry_columns
+                ])
+
+        cursor.execute("RELEASE SAVEPOINT load_match")
+        logging.info("Successfully processed data for file: %s", filename)
+        return True
+
+    except Exception as e:
+        logging.error("An unexpected error occurred while processing file %s: %s", filename, e)
+    # Rollback this file on error; the files loaded earlier in the batch stay in the open transaction
+    cursor.execute("ROLLBACK TO SAVEPOINT load_match")
+    cursor.execute("RELEASE SAVEPOINT load_match")
+    # IDs cached since the savepoint may have been inserted by the rolled-back statements. Entries are only ever
+    # added on a cache miss, so they are exactly the keys after the first lookup_cache_size ones.
+    for cache_key in list(itertools.islice(_LOOKUP_CACHE, lookup_cache_size, None)):
+        del _LOOKUP_CACHE[cache_key]
+    return False
+
+
+def move_processed_file(filepath, new_filepath):
+    """Moves a file across filesystems (copy and delete); runs on the move executor of transform_and_load."""
+    try:
+        shutil.move(filepath, new_filepath)
+        logging.info("Moved processed file to: %s", new_filepath)
+    except shutil.Error as e:
+        logging.error("Error moving processed file %s to %s: %s", filepath, new_filepath, e)
+    except OSError as e:
+        logging.error("Error moving processed file %s to %s: %s", filepath, new_filepath, e)
+
+
+def commit_batch(conn, filepaths, processed_dir, move_executor):
+    """
+    Commits the transaction holding the files loaded since the last commit, then moves them to processed_dir.
+    Files are only moved once their data is committed, so a failed batch is retried on the next run.
+    Moves that need a copy are handed to move_executor, so the next batch loads meanwhile.
+    """
+    if not filepaths:
+        return
+    try:
+        conn.commit()
+        logging.info("Committed data for a batch of %s files.", len(filepaths))
+    except psycopg2.Error as e:
+        logging.error("Error committing a batch of %s files, leaving them in the input directory: %s", len(filepaths), e)
+        conn.rollback()
+        _LOOKUP_CACHE.clear() # Cached IDs may have been inserted by the rolled-back transaction
+        filepaths.clear()
+        return
+
+    # Move the processed files to the processed directory
+    for filepath in filepaths:
+        new_filepath = os.path.join(processed_dir, os.path.basename(filepath))
+        try:
+            os.rename(filepath, new_filepath) # A single syscall when both directories are on one filesystem
+            logging.info("Moved processed file to: %s", new_filepath)
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                move_executor.submit(move_processed_file, filepath, new_filepath)
+            else:
+                logging.error("Error moving processed file %s to %s: %s", filepath, new_filepath, e)
+    filepaths.clear()
+
+
+def transform_and_load(conn):
+    """Reads JSON files, transforms data, and loads into the database."""
+    logging.info("Starting data transformation and loading process.")
+    cursor = conn.cursor()
+    # Input directory for raw JSON files (mounted from ./output/ekstraliga_scraper)
+    input_dir = '/app/ekstraligapl/output'
+    # Output directory for processed JSON files (mounted from ./output/data_transformer)
+    processed_dir = '/app/output/data_transformer'
+
+    if not os.path.exists(input_dir):
+        logging.error("Input directory not found: %s", input_dir)
+        return
+
+    # Create the processed directory if it doesn't exist
+    try:
+        os.makedirs(processed_dir, exist_ok=True)
+    except OSError as e:
+        logging.error("Error creating processed directory %s: %s", processed_dir, e)
+        return # Cannot proceed if processed directory cannot be created
+
+
+    # scandir yields the entry type from the directory listing itself, so skipping non-files costs no stat call
+    with os.scandir(input_dir) as entries:
+        filepaths = [entry.path for entry in entries if entry.name.endswith('.json') and entry.is_file()]
+    logging.info("Found %s JSON files in %s", len(filepaths), input_dir)
+
+    try:
+        preload_lookup_cache(conn)
+    except psycopg2.Error as e:
+        logging.error("Error preloading lookup tables, falling back to per-value lookups: %s", e)
+        conn.rollback()
+        _LOOKUP_CACHE.clear()
+
+    # Without it no heat participant can be inserted, so a failure here ends the run
+    type_heat_participants_query(conn)
+
+    try:
+        prepare_statements(conn)
+    except psycopg2.Error as e:
+        logging.error("Error preparing statements, falling back to plain statements: %s", e)
+        conn.rollback()
+        _LOOKUP_QUERIES.clear()
+        _PREPARED_QUERIES.clear()
+
+    # Files are read and decoded on one thread, a bounded PARSE_PREFETCH_DEPTH files ahead, while this thread waits on
+    # the database (psycopg2 releases the GIL during queries); results come back in file order
+    # Files are committed in batches of COMMIT_BATCH_SIZE, one transaction (and one WAL flush) per batch;
+    # load_match wraps each file in a savepoint, so a bad file is rolled back without the rest of its batch
+    conn.autocommit = False
+    batch_filepaths = [] # Files loaded in the open transaction, moved to processed_dir once it commits
+    try:
+        # Cross-filesystem moves (copies) run on their own threads; leaving the with block waits for the last ones
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MOVE_MAX_WORKERS) as move_executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=1) as parse_executor:
+            for filepath, match_data, error_message in iter_parsed_files(filepaths, parse_executor):
+                filename = os.path.basename(filepath)
+                logging.info("Processing file: %s", filename)
+                if error_message:
+                    logging.error(error_message)
+                    continue
+                if load_match(cursor, filename, match_data):
+                    batch_filepaths.append(filepath)
+                    if len(batch_filepaths) >= COMMIT_BATCH_SIZE:
+                        commit_batch(conn, batch_filepaths, processed_dir, move_executor)
+            commit_batch(conn, batch_filepaths, processed_dir, move_executor)
+    finally:
+        conn.rollback() # No-op after the final commit; discards a batch left open by an error
+        conn.autocommit = True # Reset autocommit
 
     cursor.close()
 
@@ -675,7 +925,7 @@ if __name__ == '__main__':
         db_conn = get_db_connection()
         transform_and_load(db_conn)
     except Exception as e:
-        logging.critical(f"Data transformation process failed: {e}")
+        logging.critical("Data transformation process failed: %s", e)
     finally:
         if db_conn:
             db_conn.close()